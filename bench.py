@@ -0,0 +1,402 @@
+# ########################################################################### #
+# Scaling benchmarks for the solvers.
+#
+# The doctests tell us an engine is right, not whether a change made it any
+# faster.  This generates seeded inputs at increasing sizes for each solver,
+# times its entry point on every one, records the peak memory of a run, and
+# fits how the time grows: an exponent of 1 means it's linear in the size, 2
+# means quadratic, and so on.
+#
+# The results can be saved as a JSON baseline and later runs compared against
+# it, flagging anything that got slower (or hungrier) by more than a threshold,
+# or whose exponent went up by more than a (separate, absolute) threshold.
+# The result cache is turned off while timing, since otherwise every run after
+# the first would just be a lookup.
+#
+# Usage:
+#   python bench.py [--quick] [--only NAME] [--save FILE] [--compare FILE]
+#                   [--threshold FRACTION] [--exponent-threshold DELTA]
+# ########################################################################### #
+
+
+import contextlib
+import io
+import json
+import math
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+
+import result_cache
+import solve
+
+SEED = 2018
+
+# Characters that show up in matrix-script inputs: letters, digits, the
+# symbols in between them, and plenty of spaces.
+MATRIX_CHARACTERS = "abcdefghijklmnopqrstuvwxyz0123456789 !@#$%&  "
+
+
+# ########################################################################### #
+# Input generators
+#
+# Each takes a random.Random and the parameters of one point of a sweep.
+# ########################################################################### #
+
+def maximize_it_input(rng, k, n, m):
+    return m, [[rng.randint(1, 10**9) for _ in range(n)] for _ in range(k)]
+
+def matrix_input(rng, rows, columns):
+    return rows, columns, [
+        "".join(rng.choice(MATRIX_CHARACTERS) for _ in range(columns))
+        for _ in range(rows)
+    ]
+
+def string_input(rng, length, alphabet):
+    r"""
+    Returns a string whose next permutation is as far from it as possible: the
+    pivot is the very first character, so every solver has to walk the whole
+    thing.
+
+    Test:
+    >>> string_input(random.Random(0), 8, 3)
+    'acbbbbbb'
+    """
+
+    letters = [chr(ord("a") + i) for i in range(alphabet)]
+    characters = sorted(rng.choice(letters) for _ in range(length))
+
+    # The smallest character goes first and the rest are in decreasing order,
+    # with something bigger than the first somewhere after it.
+    if characters[0] == characters[-1]:
+        characters[-1] = chr(ord(characters[-1]) + 1)
+    return characters[0] + "".join(sorted(characters[1:], reverse=True))
+
+def postal_codes_input(rng, count):
+    return [str(rng.randint(100000, 999999)) for _ in range(count)]
+
+def tree_input(rng, nodes):
+    r"""
+    Returns a random tree on the values 1..nodes as CSV (N,P) lines, in
+    random order.
+
+    Test:
+    >>> sorted(tree_input(random.Random(0), 3).splitlines())
+    [b'1,', b'2,3', b'3,1']
+    """
+
+    values = list(range(1, nodes + 1))
+    rng.shuffle(values)
+    lines = [b"%d," % values[0]] + [
+        b"%d,%d" % (values[i], values[rng.randrange(i)])
+        for i in range(1, nodes)
+    ]
+    rng.shuffle(lines)
+    return b"\n".join(lines) + b"\n"
+
+
+# ########################################################################### #
+# Entry points
+#
+# Each takes an input from the matching generator and runs the solver on it
+# the way main() would, minus reading stdin.
+# ########################################################################### #
+
+def run_maximize_it(data):
+    m, lists = data
+    return solve.load("maximize-it").Solver.from_lists(m, lists).solve()
+
+def run_matrix_script(data):
+    module = solve.load("matrix-script")
+    s = module.Solver.__new__(module.Solver)
+    s.N, s.M, matrix = data
+    return s.solve(matrix)
+
+def run_lex(string):
+    module = solve.load("next-lex-permutation")
+
+    # lex still prints what it's swapping.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return module.Solver(string).lex()
+
+def run_next_lex(string):
+    return solve.load("next-lex-permutation").Solver(string).next_lex()
+
+def run_next_permutation(string):
+    module = solve.load("next-lex-permutation")
+    return module.Solver(string).next_permutation()
+
+def run_binary_tree_nodes(data):
+    module = solve.load("binary-tree-nodes")
+    s = module.Solver.from_pairs([])
+    s.read(io.BytesIO(data))
+    out = io.BytesIO()
+    s.write(out)
+    return out
+
+def run_postal_codes(codes):
+    module = solve.load("validating-postal-codes")
+    s = module.Solver.__new__(module.Solver)
+    return [s.solve(P) for P in codes]
+
+def run_postal_codes_stream(codes):
+    module = solve.load("validating-postal-codes")
+    out = io.BytesIO()
+    module.stream_validate(io.BytesIO("\n".join(codes).encode()), out)
+    return out
+
+
+# ########################################################################### #
+# Sweeps
+#
+# name => (generator, entry point, [(size, parameters), ...])
+#
+# The size is what the time gets fitted against.  For the maximize-it sweeps
+# over k and n_i it's the number of combinations, which is what the brute
+# force would have to look at.
+# ########################################################################### #
+
+SWEEPS = {
+    "maximize-it/k": (maximize_it_input, run_maximize_it, [
+        (6**k, dict(k=k, n=6, m=1000)) for k in range(2, 8)]),
+    "maximize-it/n_i": (maximize_it_input, run_maximize_it, [
+        (n**4, dict(k=4, n=n, m=1000)) for n in (2, 4, 8, 16, 32)]),
+    "maximize-it/m": (maximize_it_input, run_maximize_it, [
+        (10**e, dict(k=4, n=7, m=10**e)) for e in range(2, 7)]),
+    "matrix-script/NxN": (matrix_input, run_matrix_script, [
+        (n * n, dict(rows=n, columns=n)) for n in (64, 128, 256, 512, 1024)]),
+    "matrix-script/Nx16": (matrix_input, run_matrix_script, [
+        (n * 16, dict(rows=n, columns=16)) for n in (10**3, 10**4, 10**5)]),
+    "next-lex-permutation/lex length": (string_input, run_lex, [
+        (2**e, dict(length=2**e, alphabet=26)) for e in (8, 10, 12, 14)]),
+    "next-lex-permutation/next_lex length": (string_input, run_next_lex, [
+        (n, dict(length=n, alphabet=26)) for n in (2**7, 2**8, 2**9, 2**10)]),
+    "next-lex-permutation/next_lex alphabet": (string_input, run_next_lex, [
+        (a, dict(length=2**9, alphabet=a)) for a in (2, 4, 8, 16, 26)]),
+    "next-lex-permutation/next_permutation length": (
+        string_input, run_next_permutation, [
+            (n, dict(length=n, alphabet=26))
+            for n in (2**10, 2**12, 2**14, 2**16)]),
+    "binary-tree-nodes/pairs": (tree_input, run_binary_tree_nodes, [
+        (n, dict(nodes=n)) for n in (10**3, 10**4, 10**5, 10**6)]),
+    "validating-postal-codes/solve batch": (
+        postal_codes_input, run_postal_codes, [
+            (n, dict(count=n)) for n in (10**3, 10**4, 10**5)]),
+    "validating-postal-codes/stream batch": (
+        postal_codes_input, run_postal_codes_stream, [
+            (n, dict(count=n)) for n in (10**3, 10**4, 10**5, 10**6)]),
+}
+
+
+# ########################################################################### #
+# Measuring
+# ########################################################################### #
+
+def measure(run, data, repeat=3):
+    """
+    Returns the best time of run(data) in seconds, along with the peak memory
+    in bytes that one run of it allocated.
+    """
+
+    # Enough runs per repeat to take a fifth of a second, so that timer
+    # resolution doesn't matter for the quick ones.
+    timer = timeit.Timer(lambda: run(data))
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat, number)) / number
+
+    # Tracing slows everything down, so it gets a run of its own.
+    tracemalloc.start()
+    try:
+        run(data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return seconds, peak
+
+def fit_exponent(sizes, seconds):
+    """
+    Returns the slope of log(seconds) against log(size), fitted by least
+    squares.  This is the b in seconds ~ a * size^b.
+
+    Test:
+    >>> round(fit_exponent([10, 100, 1000], [2e-6, 2e-4, 2e-2]), 6)
+    2.0
+    >>> fit_exponent([10], [1.0]) is None
+    True
+    """
+
+    if len(sizes) < 2:
+        return None
+
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(second, 1e-12)) for second in seconds]
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    covariance = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys))
+    variance = sum((x - x_mean) ** 2 for x in xs)
+    return covariance / variance
+
+def run_sweep(name, quick=False):
+    """
+    Runs every point of the named sweep and returns its results.
+    """
+
+    generate, run, points = SWEEPS[name]
+    if quick:
+        points = points[:3]
+
+    result = {"sizes": [], "seconds": [], "peak_bytes": []}
+    for size, parameters in points:
+        # Seeded by the point too, so that each input is the same run to run
+        # and doesn't depend on which other sweeps ran first.
+        rng = random.Random("%d %s %d" % (SEED, name, size))
+        data = generate(rng, **parameters)
+
+        seconds, peak = measure(run, data, repeat=1 if quick else 3)
+        result["sizes"].append(size)
+        result["seconds"].append(seconds)
+        result["peak_bytes"].append(peak)
+        print("%-46s %10d %12.3fms %10.1fKiB" % (
+            name, size, seconds * 1000, peak / 1024))
+
+    result["exponent"] = fit_exponent(result["sizes"], result["seconds"])
+    if result["exponent"] is not None:
+        print("%-46s %10s %14s" % (
+            name, "exponent", "%.2f" % result["exponent"]))
+    return result
+
+def run_all(names=None, quick=False):
+    # Repeated runs would otherwise time the cache, not the solvers.
+    result_cache.disable()
+
+    print("%-46s %10s %14s %13s" % ("sweep", "size", "time", "peak"))
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": quick,
+        "sweeps": {name: run_sweep(name, quick) for name in (SWEEPS if names is None else names)},
+    }
+
+
+# ########################################################################### #
+# Comparing against a baseline
+# ########################################################################### #
+
+def compare(baseline, current, threshold=0.25, exponent_threshold=0.2):
+    """
+    Returns a line for every point that's slower, or that peaked at more
+    memory, than the baseline by more than threshold (as a fraction), and for
+    every sweep whose fitted exponent went up by more than exponent_threshold.
+    Raises ValueError if no sweep is in both, since then nothing was compared.
+
+    Test:
+    >>> old = {"sweeps": {"s": {"sizes": [10, 100], "seconds": [1.0, 10.0],
+    ...                         "peak_bytes": [100, 100], "exponent": 1.0}}}
+    >>> new = {"sweeps": {"s": {"sizes": [10, 100], "seconds": [1.1, 20.0],
+    ...                         "peak_bytes": [100, 400], "exponent": 1.3}}}
+    >>> for line in compare(old, new):
+    ...     print(line)
+    s size 100: time 10 -> 20 (+100%)
+    s size 100: peak memory 100 -> 400 (+300%)
+    s: exponent 1.00 -> 1.30
+    >>> compare(old, old)
+    []
+    >>> new["sweeps"]["s"]["exponent"] = 1.15
+    >>> compare(old, new, threshold=3)
+    []
+    >>> compare(old, {"sweeps": {"t": new["sweeps"]["s"]}})
+    Traceback (most recent call last):
+    ...
+    ValueError: no sweeps in common with the baseline
+    """
+
+    if not baseline["sweeps"].keys() & current["sweeps"].keys():
+        raise ValueError("no sweeps in common with the baseline")
+
+    regressions = []
+    for name, new in current["sweeps"].items():
+        old = baseline["sweeps"].get(name)
+        if old is None:
+            continue
+
+        old_points = dict(zip(old["sizes"], zip(old["seconds"],
+                                                old["peak_bytes"])))
+        for size, seconds, peak in zip(new["sizes"], new["seconds"],
+                                       new["peak_bytes"]):
+            if size not in old_points:
+                continue
+
+            for what, before, after in [
+                ("time", old_points[size][0], seconds),
+                ("peak memory", old_points[size][1], peak),
+            ]:
+                if before and after > before * (1 + threshold):
+                    regressions.append(
+                        "%s size %d: %s %.3g -> %.3g (%+.0f%%)" % (
+                            name, size, what, before, after,
+                            (after / before - 1) * 100))
+
+        if (old["exponent"] is not None and new["exponent"] is not None
+                and new["exponent"] > old["exponent"] + exponent_threshold):
+            regressions.append("%s: exponent %.2f -> %.2f" % (
+                name, old["exponent"], new["exponent"]))
+
+    return regressions
+
+def option(argv, name, default=None):
+    """
+    Returns the value following a --name in argv, or default.
+
+    Test:
+    >>> option(["--save", "out.json"], "--save")
+    'out.json'
+    >>> option([], "--threshold", "0.25")
+    '0.25'
+    """
+
+    if name in argv:
+        return argv[argv.index(name) + 1]
+    return default
+
+def main(argv):
+    only = option(argv, "--only")
+    names = [name for name in SWEEPS if only in name] if only else None
+    if names == []:
+        print("bench.py: no sweep matches %r" % only, file=sys.stderr)
+        return 2
+
+    results = run_all(names, quick="--quick" in argv)
+
+    save = option(argv, "--save")
+    if save is not None:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    baseline = option(argv, "--compare")
+    if baseline is not None:
+        with open(baseline) as f:
+            baseline = json.load(f)
+
+        threshold = float(option(argv, "--threshold", "0.25"))
+        exponent_threshold = float(option(argv, "--exponent-threshold", "0.2"))
+        try:
+            regressions = compare(baseline, results, threshold,
+                                  exponent_threshold)
+        except ValueError as error:
+            print("bench.py: %s" % error, file=sys.stderr)
+            return 2
+
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+        print("No regressions beyond %.0f%% (%+.2f in exponent)" % (
+            threshold * 100, exponent_threshold))
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,429 @@
+# ########################################################################### #
+# The same problem as binary-tree-nodes.sql:
+# https://www.hackerrank.com/challenges/binary-search-tree-1/problem
+#
+# Given a table BST of (N, P) pairs, where N is the value of a node in a binary
+# tree and P is the value of its parent, print every node ordered by N along
+# with its type:
+#   Root: If node is root node.
+#   Leaf: If node is leaf node.
+#   Inner: If node is neither root nor leaf node.
+#
+# The input is one pair per line, as CSV (or separated by whitespace) with an
+# empty, NULL or null P for the root.  With --binary it's instead a stream of
+# little-endian int64 pairs, with -1 as the null parent.
+#
+# The output is "N Type" lines, exactly like the query's.
+# ########################################################################### #
+
+
+# The SQL joins the table with itself to find out which nodes have children,
+# which is great on a sample but means building (and then DISTINCT-ing) a row
+# for every parent/child pair.  With hundreds of millions of edges that's a lot
+# of rows to learn one bit per node.
+#
+# Looking at the CASE again, all that we need to know about a node is:
+# - Did it show up as an N?  (Only those get printed.)
+# - Did it show up as somebody's P?  (Then it has a child.)
+# - Was its own P null?  (Then it's the root.)
+#
+# That's three bits, and none of them depend on the order the pairs come in, so
+# one pass over the pairs can set them all.  If the flags are kept in a table
+# indexed by node value, then reading them back in index order even gives us
+# the ORDER BY N for free.
+#
+# Node values are non-negative integers.  When they're numbered more or less
+# 1..n (like the sample), a bytearray with one byte per value is about as
+# compact as it gets.  If they're spread way out then most of that table would
+# be empty, so past a point the flags move into a dict and get sorted at the
+# end instead.
+
+
+import sys
+import io
+import os
+import array
+
+from lazy_import import lazy_import
+import instrument
+
+# NumPy is optional, it just marks a whole chunk of pairs at once.
+np = lazy_import("numpy")
+
+# The flags kept for every node value.
+NODE, HAS_CHILD, ROOT = 1, 2, 4
+
+# What the query prints for each combination of flags.  Root wins over Inner,
+# just like the order of the WHEN's.
+TYPES = [
+    "Root" if flags & ROOT else "Inner" if flags & HAS_CHILD else "Leaf"
+    for flags in range(8)
+]
+
+# The null parent in binary input.
+NULL = -1
+
+# How many bytes of input are read at a time.
+CHUNK_SIZE = 2**20
+
+# The flat table can always grow to this many values...
+DENSE_MINIMUM = 2**20
+# ...and after that to this many values per pair (read so far, or expected from
+# the size of the input).  A dict entry costs something like 100 bytes, so the
+# table stays the smaller of the two well past this.  Anything more spread out
+# than that and the dict takes over.
+DENSE_PER_PAIR = 32
+
+# A guess at the bytes per pair of CSV, for guessing how many pairs a file has.
+CSV_BYTES_PER_PAIR = 12
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The sample from the problem.
+SAMPLE = [(1, 2), (3, 2), (6, 8), (9, 8), (2, 5), (8, 5), (5, None)]
+
+
+def parse_csv(block):
+    r"""
+    Parses a block of whole lines into a list of N's and a list of P's, with
+    NULL for a missing parent.  Lines that don't start with a number (like a
+    header) are skipped.
+
+    Test:
+    >>> parse_csv(b"N,P\n1,2\n5,NULL\n7 5\n8,\n")
+    ([1, 5, 7, 8], [2, -1, 5, -1])
+    """
+
+    ns = []
+    ps = []
+    for line in block.split(b"\n"):
+        fields = line.replace(b",", b" ").split()
+        if not fields or not fields[0].isdigit():
+            continue
+
+        ns.append(int(fields[0]))
+        if len(fields) > 1 and fields[1].isdigit():
+            ps.append(int(fields[1]))
+        else:
+            ps.append(NULL)
+    return ns, ps
+
+def read_csv(stream, chunk_size=CHUNK_SIZE):
+    r"""
+    Reads a binary stream of CSV a chunk at a time and yields (N's, P's) for
+    each block of whole lines.
+
+    Test:
+    >>> list(read_csv(io.BytesIO(b"1,2\n5,\n"), chunk_size=3))
+    [([1], [2]), ([5], [-1])]
+    """
+
+    carry = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        block = carry + chunk
+        cut = block.rfind(b"\n") + 1
+        carry = block[cut:]
+        if cut:
+            yield parse_csv(block[:cut])
+
+    if carry:
+        yield parse_csv(carry)
+
+def read_binary(stream, chunk_size=CHUNK_SIZE):
+    """
+    Reads a binary stream of little-endian int64 (N, P) pairs a chunk at a time
+    and yields (N's, P's) for each chunk as arrays.
+
+    Test:
+    >>> import struct
+    >>> data = struct.pack("<4q", 1, 2, 5, -1)
+    >>> [(list(ns), list(ps)) for ns, ps in read_binary(io.BytesIO(data), 8)]
+    [([1], [2]), ([5], [-1])]
+    """
+
+    # Whole pairs only, so every chunk splits evenly into N's and P's.
+    chunk_size = max(16, chunk_size - chunk_size % 16)
+
+    carry = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        block = carry + chunk
+        cut = len(block) - len(block) % 16
+        carry = block[cut:]
+
+        pairs = array.array("q")
+        pairs.frombytes(block[:cut])
+        if sys.byteorder == "big":
+            pairs.byteswap()
+        yield pairs[0::2], pairs[1::2]
+
+    if carry:
+        raise ValueError("binary input ends partway through a pair")
+
+
+class Solver:
+    def __init__(self, path=None, binary=False):
+        r"""
+        Reads the (N, P) pairs from stdin, or from the file at path.
+
+        Produces:
+        self.flags := bytearray of flags indexed by node value
+        self.sparse := dict of node value => flags, once the values are too
+                       spread out for self.flags (None until then)
+        self.pairs := How many pairs have been read
+        self.expected := How many pairs there look to be, from the input size
+
+        Test:
+        >>> stdin = sys.stdin
+        >>> def cleanup():
+        ...     sys.stdin = stdin
+        >>> sys.stdin = io.StringIO("1,2\n3,2\n2,\n")
+        >>> Solver().solve()
+        [(1, 'Leaf'), (2, 'Root'), (3, 'Leaf')]
+        >>> cleanup()
+        """
+
+        self.flags = bytearray()
+        self.sparse = None
+        self.pairs = self.expected = 0
+
+        if path is not None:
+            with open(path, "rb") as stream:
+                self.read(stream, binary)
+        else:
+            stream = getattr(sys.stdin, "buffer", None)
+            if stream is None:
+                stream = io.BytesIO(sys.stdin.read().encode())
+            self.read(stream, binary)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Makes a solver from (N, P) pairs, with None for a missing parent.
+
+        Test:
+        >>> Solver.from_pairs([(2, None), (1, 2)]).solve()
+        [(1, 'Leaf'), (2, 'Root')]
+        """
+
+        solver = cls.__new__(cls)
+        solver.flags = bytearray()
+        solver.sparse = None
+        solver.pairs = 0
+
+        pairs = list(pairs)
+        solver.expected = len(pairs)
+        solver.add([n for n, p in pairs],
+                   [NULL if p is None else p for n, p in pairs])
+        return solver
+
+    def read(self, stream, binary=False):
+        """
+        Adds every pair from a binary stream, in CSV or binary.
+        """
+
+        # If the stream is a file, then its size says roughly how many pairs
+        # are coming.  Otherwise we only know what's been read so far.
+        try:
+            size = os.fstat(stream.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            size = 0
+        self.expected += size // (16 if binary else CSV_BYTES_PER_PAIR)
+
+        for ns, ps in (read_binary if binary else read_csv)(stream):
+            self.add(ns, ps)
+
+    def add(self, ns, ps):
+        """
+        Adds a chunk of pairs, given as a sequence of N's and a sequence of the
+        matching P's (NULL for the root).
+
+        Test:
+        >>> s = Solver.from_pairs([])
+        >>> s.add([1, 3], [2, 2])
+        >>> s.add([2], [NULL])
+        >>> s.flags[:4] == bytes([0, NODE, HAS_CHILD | NODE | ROOT, NODE])
+        True
+        """
+
+        if not len(ns):
+            return
+
+        self.pairs += len(ns)
+        instrument.count("binary-tree-nodes.pairs", len(ns))
+
+        vectorized = np is not None and len(ns) > 64
+        if vectorized:
+            ns = np.asarray(ns, dtype=np.int64)
+            ps = np.asarray(ps, dtype=np.int64)
+            top, lowest = int(max(ns.max(), ps.max())), int(ns.min())
+        else:
+            top, lowest = max(max(ns), max(ps)), min(ns)
+
+        if lowest < 0:
+            raise ValueError("node values have to be non-negative")
+        if self.sparse is None and top >= len(self.flags):
+            self.reserve(top + 1)
+
+        if self.sparse is not None:
+            self.add_sparse(ns, ps)
+        elif vectorized:
+            self.add_numpy(ns, ps)
+        else:
+            flags = self.flags
+            for n, p in zip(ns, ps):
+                if p == NULL:
+                    flags[n] |= NODE | ROOT
+                else:
+                    flags[n] |= NODE
+                    flags[p] |= HAS_CHILD
+
+    def reserve(self, size):
+        """
+        Grows the flat table to hold size values, or switches over to the dict
+        if that would be too big for the number of pairs read.
+        """
+
+        limit = max(DENSE_MINIMUM,
+                    DENSE_PER_PAIR * max(self.pairs, self.expected))
+        if size > limit:
+            self.sparse = {
+                value: flags for value, flags in enumerate(self.flags) if flags
+            }
+            self.flags = bytearray()
+            return
+
+        # Doubling keeps the number of copies down as the values climb.
+        size = min(max(size, 2 * len(self.flags)), limit)
+        self.flags.extend(bytes(size - len(self.flags)))
+
+    def add_numpy(self, ns, ps):
+        # Or-ing with a constant gives the same answer no matter how many times
+        # a value repeats, so plain fancy indexing is fine here.
+        flags = np.frombuffer(self.flags, dtype=np.uint8)
+        roots = ps == NULL
+        flags[ns] |= NODE
+        flags[ns[roots]] |= ROOT
+        flags[ps[~roots]] |= HAS_CHILD
+
+    def add_sparse(self, ns, ps):
+        sparse = self.sparse
+        for n, p in zip(list(ns), list(ps)):
+            if p == NULL:
+                sparse[n] = sparse.get(n, 0) | NODE | ROOT
+            else:
+                sparse[n] = sparse.get(n, 0) | NODE
+                sparse[p] = sparse.get(p, 0) | HAS_CHILD
+
+    def classify_chunks(self):
+        """
+        Yields (N's, flags) lists for every node, a chunk at a time, ordered
+        by N.
+        """
+
+        if self.sparse is not None:
+            values = sorted(value for value, flags in self.sparse.items()
+                            if flags & NODE)
+            for start in range(0, len(values), 2**16):
+                chunk = values[start:start + 2**16]
+                yield chunk, list(map(self.sparse.__getitem__, chunk))
+            return
+
+        for start in range(0, len(self.flags), 2**16):
+            chunk = self.flags[start:start + 2**16]
+            if np is not None:
+                # Finding the nodes in the chunk is one vectorized pass.
+                table = np.frombuffer(chunk, dtype=np.uint8)
+                values = np.flatnonzero(table & NODE)
+                yield (values + start).tolist(), table[values].tolist()
+            else:
+                values = [i for i, flags in enumerate(chunk) if flags & NODE]
+                yield ([start + i for i in values],
+                       list(map(chunk.__getitem__, values)))
+
+    def classify(self):
+        """
+        Yields (N, flags) for every node, ordered by N.
+        """
+
+        for values, flags in self.classify_chunks():
+            yield from zip(values, flags)
+
+    def solve(self):
+        """
+        Returns (N, type) for every node, ordered by N.
+
+        Test:
+        >>> Solver.from_pairs(SAMPLE).solve()
+        [(1, 'Leaf'), (2, 'Inner'), (3, 'Leaf'), (5, 'Root'), (6, 'Leaf'), (8, 'Inner'), (9, 'Leaf')]
+
+        And it's the same thing the query comes up with:
+        >>> import sqlite3
+        >>> db = sqlite3.connect(":memory:")
+        >>> _ = db.execute("CREATE TABLE BST (N INTEGER, P INTEGER)")
+        >>> _ = db.executemany("INSERT INTO BST VALUES (?, ?)", SAMPLE)
+        >>> with open(os.path.join(HERE, "binary-tree-nodes.sql")) as f:
+        ...     query = f.read()
+        >>> db.execute(query).fetchall() == Solver.from_pairs(SAMPLE).solve()
+        True
+
+        Even when the values are too spread out for the flat table:
+        >>> spread = [(10**12, None), (1, 10**12), (5, 1)]
+        >>> s = Solver.from_pairs(spread)
+        >>> s.sparse is not None
+        True
+        >>> s.solve()
+        [(1, 'Inner'), (5, 'Leaf'), (1000000000000, 'Root')]
+        """
+
+        return [(value, TYPES[flags]) for value, flags in self.classify()]
+
+    def write(self, out):
+        r"""
+        Writes "N Type" lines for every node to the binary stream out, a chunk
+        at a time.
+
+        Test:
+        >>> out = io.BytesIO()
+        >>> Solver.from_pairs([(2, None), (1, 2)]).write(out)
+        >>> out.getvalue()
+        b'1 Leaf\n2 Root\n'
+        """
+
+        suffixes = [b" %s\n" % name.encode() for name in TYPES]
+
+        # Formatting a whole chunk with map keeps the per-node work in C.
+        line = b"%d%s".__mod__
+        for values, flags in self.classify_chunks():
+            out.write(b"".join(map(
+                line, zip(values, map(suffixes.__getitem__, flags)))))
+
+def main(argv=()):
+    """
+    Classifies the pairs on stdin (or in the file given), as CSV or with
+    --binary as int64 pairs.
+    """
+
+    binary = "--binary" in argv
+    paths = [arg for arg in argv if not arg.startswith("--")]
+
+    with instrument.phase("parse"):
+        solver = Solver(paths[0] if paths else None, binary)
+    with instrument.phase("emit"):
+        solver.write(sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+
+if __name__ == "__main__":
+    # The doctests only run for a plain run of the script.
+    if not sys.argv[1:]:
+        import doctest
+        doctest.testmod()
+
+    main(sys.argv[1:])
@@ -0,0 +1,302 @@
+# ########################################################################### #
+# A long running server for the solvers.
+#
+# Even through solve.py, a one-shot run pays for starting the interpreter and
+# importing a solver, which is most of the time for a small input.  The server
+# loads each solver once and then answers requests over a Unix domain socket.
+#
+# The protocol is as simple as I could make it.  A request is a header line
+#   <solver> <number of input bytes> [args...]\n
+# followed by the input, exactly as it would be given on stdin.  A response is
+#   ok <number of output bytes>\n      or      error <number of bytes>\n
+# followed by what the solver would have printed (or the error message).  Any
+# number of requests can be sent over one connection.
+#
+# Small requests are run right in the server, a batch at a time: everything
+# that's waiting gets run before the server goes back to reading sockets.  Big
+# ones go to a pool of worker processes so that they don't hold everyone else
+# up: lots of input, the batch, stream and enumeration modes, or anything that
+# a solver's cost(argv, data) estimates is a lot of work (a big maximize-it
+# instance is only a couple hundred bytes).  The pool already has a process
+# per core, so those run with --workers 1 rather than starting pools of their
+# own.
+#
+# The server turns on the result cache, since it sees the same inputs over and
+# over.  A request for "cache-stats" (with no input) gets back its counters, to
+# help with sizing it.
+#
+# The socket lives in the temp directory unless $SOLVER_SOCKET says otherwise.
+#
+# Usage:
+#   python daemon.py serve [SOCKET]
+#   python daemon.py client SOLVER [ARGS...] < input
+#   python daemon.py benchmark [REQUESTS] [CONCURRENCY]
+# ########################################################################### #
+
+
+import asyncio
+import concurrent.futures
+import io
+import os
+import sys
+import tempfile
+
+import result_cache
+import solve
+
+SOCKET_PATH = os.environ.get(
+    "SOLVER_SOCKET",
+    os.path.join(tempfile.gettempdir(), "coding-challenges.sock"))
+
+# Requests with more input than this go to the worker processes.
+HEAVY_BYTES = 2**16
+
+# As do requests with any of these arguments.
+HEAVY_ARGS = {"--all", "--batch", "--stream", "--parallel", "--build-bitmap"}
+
+# And requests which a solver's cost() estimates at more than this much work,
+# which is somewhere around a few milliseconds.
+HEAVY_COST = 10**6
+
+def run_solver(name, argv, data):
+    r"""
+    Runs a solver's main with data as its stdin and returns what it printed.
+
+    Test:
+    >>> run_solver("maximize-it", [], b"2 100\n2 8 12\n1 3\n")
+    b'73\n'
+    """
+
+    module = solve.load(name)
+
+    stdin = io.TextIOWrapper(io.BytesIO(data))
+    stdout = io.TextIOWrapper(io.BytesIO(), write_through=True)
+    saved = sys.stdin, sys.stdout
+    sys.stdin, sys.stdout = stdin, stdout
+    try:
+        module.main(argv)
+        stdout.flush()
+    finally:
+        sys.stdin, sys.stdout = saved
+
+    return stdout.buffer.getvalue()
+
+def is_heavy(name, argv, data):
+    r"""
+    Returns whether a request should go to the worker processes.
+
+    Test:
+    >>> is_heavy("maximize-it", [], b"3 1000\n2 5 4\n3 7 8 9\n5 5 7 8 9 10\n")
+    False
+    >>> big = b"20 999999937\n" + b"7 1 2 3 4 5 6 7\n" * 20
+    >>> is_heavy("maximize-it", [], big)
+    True
+    >>> is_heavy("validating-postal-codes", ["--stream"], b"110000\n")
+    True
+    >>> is_heavy("validating-postal-codes", ["--build-bitmap"], b"")
+    True
+    """
+
+    if len(data) > HEAVY_BYTES or not HEAVY_ARGS.isdisjoint(argv):
+        return True
+
+    cost = getattr(solve.load(name), "cost", None)
+    return cost is not None and cost(argv, data) > HEAVY_COST
+
+class Server:
+    def __init__(self, workers=None):
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers)
+        self.small = asyncio.Queue()
+
+        result_cache.configure()
+
+        # Loading every solver up front keeps the first requests fast.
+        for name in solve.SOLVERS:
+            solve.load(name)
+
+    async def run_small(self):
+        r"""
+        Runs small requests a batch at a time, for as long as the server is up.
+
+        Test:
+        A request whose future was cancelled while it waited (say, because
+        its connection closed) is skipped, and the ones after it still run.
+        >>> async def check():
+        ...     server = Server(workers=1)
+        ...     small = asyncio.ensure_future(server.run_small())
+        ...     gone = asyncio.get_running_loop().create_future()
+        ...     gone.cancel()
+        ...     data = b"1 10\n1 3\n"
+        ...     await server.small.put(("maximize-it", [], data, gone))
+        ...     try:
+        ...         answer = server.answer("maximize-it", [], data)
+        ...         return await asyncio.wait_for(answer, 10)
+        ...     finally:
+        ...         small.cancel()
+        ...         server.pool.shutdown()
+        ...         result_cache.disable()
+        >>> asyncio.run(check())
+        b'9\n'
+        """
+
+        while True:
+            batch = [await self.small.get()]
+            while not self.small.empty():
+                batch.append(self.small.get_nowait())
+
+            for name, argv, data, result in batch:
+                # Setting a result on it would raise, and take this task (and
+                # every small request after it) down with it.
+                if result.done():
+                    continue
+
+                try:
+                    result.set_result(run_solver(name, argv, data))
+                except Exception as error:
+                    result.set_exception(error)
+
+    async def answer(self, name, argv, data):
+        if name == "cache-stats":
+            return ("%r\n" % result_cache.CACHE.stats()).encode()
+
+        if name not in solve.SOLVERS:
+            raise ValueError("unknown solver %r" % name)
+
+        if is_heavy(name, argv, data):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.pool, run_solver, name, argv + ["--workers", "1"], data)
+
+        result = asyncio.get_running_loop().create_future()
+        await self.small.put((name, argv, data, result))
+        return await result
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readline()
+                if not header:
+                    break
+
+                name, length, *argv = header.decode().split()
+                data = await reader.readexactly(int(length))
+
+                try:
+                    status, body = b"ok", await self.answer(name, argv, data)
+                except Exception as error:
+                    status, body = b"error", repr(error).encode()
+
+                writer.write(b"%s %d\n" % (status, len(body)) + body)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, path=SOCKET_PATH):
+        if os.path.exists(path):
+            os.remove(path)
+
+        small = asyncio.ensure_future(self.run_small())
+        server = await asyncio.start_unix_server(self.handle, path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            small.cancel()
+            self.pool.shutdown()
+
+async def request(reader, writer, name, data, argv=()):
+    """
+    Sends one request over an open connection and returns the output.
+    """
+
+    writer.write(" ".join([name, str(len(data)), *argv]).encode() + b"\n")
+    writer.write(data)
+    await writer.drain()
+
+    status, length = (await reader.readline()).split()
+    body = await reader.readexactly(int(length))
+    if status != b"ok":
+        raise RuntimeError(body.decode())
+    return body
+
+async def client(name, data, argv=(), path=SOCKET_PATH):
+    """
+    Opens a connection, sends one request, and returns the output.
+    """
+
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        return await request(reader, writer, name, data, argv)
+    finally:
+        writer.close()
+
+def benchmark(requests=2000, concurrency=16, path=SOCKET_PATH):
+    """
+    Starts a server and sends it requests for every solver from concurrency
+    connections at once, then times the same number of one-shot runs of
+    solve.py for comparison.
+    """
+
+    import subprocess
+    import time
+
+    # A socket left over from an earlier server would look like this one is
+    # already up.
+    if os.path.exists(path):
+        os.remove(path)
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", path])
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+
+        samples = list(solve.SAMPLE_INPUTS.items())
+
+        async def connection(count):
+            reader, writer = await asyncio.open_unix_connection(path)
+            for i in range(count):
+                name, data = samples[i % len(samples)]
+                await request(reader, writer, name, data)
+            writer.close()
+
+        async def load():
+            per_connection = requests // concurrency
+            await asyncio.gather(
+                *(connection(per_connection) for _ in range(concurrency)))
+
+        start = time.perf_counter()
+        asyncio.run(load())
+        served = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    one_shots = max(1, requests // 100)
+    start = time.perf_counter()
+    for i in range(one_shots):
+        name, data = samples[i % len(samples)]
+        subprocess.run([sys.executable, solve.__file__, name], input=data,
+                       stdout=subprocess.DEVNULL, check=True)
+    one_shot = (time.perf_counter() - start) / one_shots
+
+    served_requests = requests // concurrency * concurrency
+    print("server:   %8.0f requests/s" % (served_requests / served))
+    print("one-shot: %8.0f requests/s" % (1 / one_shot))
+
+def main(argv):
+    if argv[:1] == ["serve"]:
+        asyncio.run(Server().serve(*argv[1:2]))
+    elif argv[:1] == ["client"]:
+        data = sys.stdin.buffer.read()
+        sys.stdout.buffer.write(asyncio.run(client(argv[1], data, argv[2:])))
+    elif argv[:1] == ["benchmark"]:
+        benchmark(*map(int, argv[1:3]))
+    else:
+        print("usage: daemon.py {serve [SOCKET] | client SOLVER [ARGS...] | "
+              "benchmark [REQUESTS] [CONCURRENCY]}", file=sys.stderr)
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,82 @@
+# ########################################################################### #
+# Reading input
+#
+# Every Solver used to read stdin as text a line at a time, which decodes the
+# whole input and makes a Python object per line (and usually per token) before
+# parsing even starts.  These read everything in one go as bytes and do the
+# splitting with single calls that run in C.
+# ########################################################################### #
+
+
+import mmap
+import sys
+
+def read_input(path=None):
+    r"""
+    Returns all of stdin as bytes, or the file at path memory mapped.
+
+    Falls back to reading text if stdin has been replaced with something that
+    doesn't have a binary buffer (like the io.StringIO in the doctests).
+
+    Test:
+    >>> import io
+    >>> stdin = sys.stdin
+    >>> sys.stdin = io.StringIO("2 100\n2 8 12\n")
+    >>> read_input()
+    b'2 100\n2 8 12\n'
+    >>> sys.stdin = stdin
+    """
+
+    if path is not None:
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    buffer = getattr(sys.stdin, "buffer", None)
+    if buffer is not None:
+        return buffer.read()
+    return sys.stdin.read().encode()
+
+def split_header(data):
+    r"""
+    Returns the integers on the first line of data, and the offset where the
+    next line starts.
+
+    Test:
+    >>> split_header(b"7 3\nTsi\n")
+    ([7, 3], 4)
+    >>> split_header(b"7 3")
+    ([7, 3], 4)
+    """
+
+    end = data.find(b"\n")
+    if end < 0:
+        end = len(data)
+    return list(map(int, data[:end].split())), end + 1
+
+def lines(data):
+    r"""
+    Splits data (bytes or str) into lines the way iterating over a file does,
+    minus the newlines: a trailing newline doesn't start another (empty) line.
+    Like text mode, "\r\n" and "\r" count as newlines too.
+
+    Test:
+    >>> lines(b"wic\noto\n $l\n")
+    [b'wic', b'oto', b' $l']
+    >>> lines(b"wic\n\n")
+    [b'wic', b'']
+    >>> lines(b"")
+    []
+    >>> lines("wic\r\noto\r\n")
+    ['wic', 'oto']
+    """
+
+    newline, cr = ("\n", "\r") if isinstance(data, str) else (b"\n", b"\r")
+
+    # Only pay for the replaces when there's something to replace.
+    if cr in data:
+        data = data.replace(cr + newline, newline).replace(cr, newline)
+
+    rows = data.split(newline)
+    if not rows[-1]:
+        rows.pop()
+    return rows
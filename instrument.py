@@ -0,0 +1,138 @@
+# ########################################################################### #
+# Instrumentation
+#
+# When a run is slow it's hard to tell whether the time went to parsing, to the
+# solve itself, or to printing, and how much work the solve actually did.  The
+# solvers report that here: phase() times a block, and count() adds to a
+# counter of work done (combinations checked, characters transposed, ...).
+#
+# None of it is on unless something is collecting.  Until then phase() hands
+# back a shared do-nothing context manager and count() returns right away, and
+# the solvers only call either outside of their inner loops.
+#
+# Usage:
+#   with collect() as stats:
+#       ...
+#   stats["phases"]["solve"], stats["counters"]["maximize-it.tuples"]
+# ########################################################################### #
+
+
+import collections
+import contextlib
+import io
+import time
+
+# The stats being collected into, or None when nothing is collecting.
+STATS = None
+
+# Handed out by phase() while nothing is collecting.
+_NOTHING = contextlib.nullcontext()
+
+def enabled():
+    return STATS is not None
+
+def count(name, n=1):
+    """
+    Adds n to the named counter, if anything is collecting.
+
+    Test:
+    >>> count("nobody.listening")
+    >>> with collect() as stats:
+    ...     count("work", 3)
+    ...     count("work")
+    >>> stats["counters"]
+    {'work': 4}
+    """
+
+    if STATS is not None:
+        STATS["counters"][name] += n
+
+def phase(name):
+    """
+    Returns a context manager which adds the time spent inside of it to the
+    named phase, if anything is collecting.
+
+    Test:
+    >>> with phase("parse"):
+    ...     pass
+    >>> with collect() as stats:
+    ...     with phase("parse"):
+    ...         pass
+    >>> list(stats["phases"])
+    ['parse']
+    """
+
+    if STATS is None:
+        return _NOTHING
+    return _timed(STATS["phases"], name)
+
+@contextlib.contextmanager
+def _timed(phases, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+@contextlib.contextmanager
+def collect(callback=None, profile=False, trace_memory=False):
+    """
+    Collects stats for everything run inside of it, and yields the dict they
+    go into:
+
+    stats["phases"] := phase name => seconds
+    stats["counters"] := counter name => total
+    stats["profile"] := the cProfile report, if profile is set
+    stats["peak_bytes"] := the tracemalloc peak, if trace_memory is set
+
+    The dict is only complete once the block is done, at which point it's
+    also passed to callback.  Collecting can be nested, the inner block just
+    gets its own stats.
+
+    Test:
+    >>> reports = []
+    >>> with collect(reports.append, profile=True, trace_memory=True) as stats:
+    ...     count("items", 2)
+    ...     data = list(range(1000))
+    >>> reports == [stats]
+    True
+    >>> stats["counters"], stats["peak_bytes"] > 0
+    ({'items': 2}, True)
+    >>> "function calls" in stats["profile"]
+    True
+    >>> enabled()
+    False
+    """
+
+    global STATS
+
+    stats = {"phases": {}, "counters": collections.Counter()}
+    outer, STATS = STATS, stats
+
+    if profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+
+    try:
+        yield stats
+    finally:
+        if trace_memory:
+            stats["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if profile:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats(
+                "cumulative").print_stats(25)
+            stats["profile"] = report.getvalue()
+
+        STATS = outer
+        stats["counters"] = dict(stats["counters"])
+
+        if callback is not None:
+            callback(stats)
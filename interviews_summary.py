@@ -0,0 +1,374 @@
+# ########################################################################### #
+# Incremental interviews report
+#
+# interviews.sql sums every row of View_Stats and Submission_Stats each time
+# it's run, and we run it after every stats ingest.  This keeps those sums per
+# contest in a summary table instead, so the report only has to read that.
+#
+# The summary is kept up to date by triggers, so it doesn't matter whether rows
+# come in through ingest() here or through anything else writing to the
+# database.  Every insert, update, or delete on a Stats table adds its
+# difference to the sums of the contests its challenge belongs to.  Changes to
+# Challenges and Colleges are handled the same way, moving the stats of the
+# challenges involved from one contest to another.
+#
+# A row counts towards a contest once for every way of reaching its challenge
+# from the contest (through Colleges and then Challenges), exactly as in the
+# query's joins, so the two agree even if a challenge turns up twice.  Like the
+# problem, this assumes contest_id is unique in Contests.
+#
+# Usage:
+#   install(db)
+#   ingest(db, view_stats=[(challenge_id, views, unique_views), ...])
+#   report(db)
+#   python interviews_summary.py [rows] [batch]
+# ########################################################################### #
+
+
+import sqlite3
+import sys
+import time
+
+SUMMARY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Contest_Summary (
+    contest_id INT PRIMARY KEY
+    ,total_submissions INT NOT NULL DEFAULT 0
+    ,total_accepted_submissions INT NOT NULL DEFAULT 0
+    ,total_views INT NOT NULL DEFAULT 0
+    ,total_unique_views INT NOT NULL DEFAULT 0
+);
+
+-- The triggers look challenges and colleges up by id from both directions.
+CREATE INDEX IF NOT EXISTS summary_contests ON Contests (contest_id);
+CREATE INDEX IF NOT EXISTS summary_colleges ON Colleges (college_id);
+CREATE INDEX IF NOT EXISTS summary_challenges ON Challenges (challenge_id);
+CREATE INDEX IF NOT EXISTS summary_college_challenges
+    ON Challenges (college_id);
+CREATE INDEX IF NOT EXISTS summary_view_stats ON View_Stats (challenge_id);
+CREATE INDEX IF NOT EXISTS summary_submission_stats
+    ON Submission_Stats (challenge_id);
+"""
+
+# Adds one row of differences per contest to the summary.  The select needs a
+# WHERE for SQLite to tell its end from the ON CONFLICT.
+ADD = """
+INSERT INTO Contest_Summary
+    (contest_id, total_submissions, total_accepted_submissions,
+     total_views, total_unique_views)
+{select}
+ON CONFLICT (contest_id) DO UPDATE SET
+    total_submissions = total_submissions + excluded.total_submissions
+    ,total_accepted_submissions =
+        total_accepted_submissions + excluded.total_accepted_submissions
+    ,total_views = total_views + excluded.total_views
+    ,total_unique_views = total_unique_views + excluded.total_unique_views;
+"""
+
+# table => a select of the differences one of its rows makes, where {row} is
+# NEW or OLD and {sign} is 1 or -1.
+DIFFERENCES = {
+    # A Stats row counts towards every contest its challenge is in.
+    "View_Stats": """
+SELECT Colleges.contest_id, 0, 0,
+    {sign} * IFNULL({row}.total_views, 0), {sign} * IFNULL({row}.total_unique_views, 0)
+FROM Challenges
+    INNER JOIN Colleges ON Challenges.college_id = Colleges.college_id
+WHERE Challenges.challenge_id = {row}.challenge_id
+""",
+    "Submission_Stats": """
+SELECT Colleges.contest_id,
+    {sign} * IFNULL({row}.total_submissions, 0),
+    {sign} * IFNULL({row}.total_accepted_submissions, 0), 0, 0
+FROM Challenges
+    INNER JOIN Colleges ON Challenges.college_id = Colleges.college_id
+WHERE Challenges.challenge_id = {row}.challenge_id
+""",
+
+    # A challenge brings all of its stats to every contest its college is in.
+    "Challenges": """
+SELECT Colleges.contest_id,
+    {sign} * (SELECT IFNULL(SUM(total_submissions), 0)
+              FROM Submission_Stats WHERE challenge_id = {row}.challenge_id),
+    {sign} * (SELECT IFNULL(SUM(total_accepted_submissions), 0)
+              FROM Submission_Stats WHERE challenge_id = {row}.challenge_id),
+    {sign} * (SELECT IFNULL(SUM(total_views), 0)
+              FROM View_Stats WHERE challenge_id = {row}.challenge_id),
+    {sign} * (SELECT IFNULL(SUM(total_unique_views), 0)
+              FROM View_Stats WHERE challenge_id = {row}.challenge_id)
+FROM Colleges
+WHERE Colleges.college_id = {row}.college_id
+""",
+
+    # And a college brings the stats of all of its challenges to its contest.
+    "Colleges": """
+SELECT {row}.contest_id,
+    {sign} * IFNULL(SUM(Stats.total_submissions), 0),
+    {sign} * IFNULL(SUM(Stats.total_accepted_submissions), 0),
+    {sign} * IFNULL(SUM(Stats.total_views), 0),
+    {sign} * IFNULL(SUM(Stats.total_unique_views), 0)
+FROM (
+    SELECT challenge_id, total_submissions, total_accepted_submissions,
+        0 AS total_views, 0 AS total_unique_views
+    FROM Submission_Stats
+    UNION ALL
+    SELECT challenge_id, 0, 0, total_views, total_unique_views
+    FROM View_Stats
+) AS Stats
+    INNER JOIN Challenges ON Stats.challenge_id = Challenges.challenge_id
+WHERE Challenges.college_id = {row}.college_id
+""",
+}
+
+def triggers():
+    """
+    Returns the statements creating the triggers which keep the summary up to
+    date: one for each of insert, delete, and update on each table feeding it.
+
+    Test:
+    >>> len(triggers())
+    12
+    """
+
+    statements = []
+    for table, select in DIFFERENCES.items():
+        add = ADD.format(select=select.format(row="NEW", sign=1).strip())
+        remove = ADD.format(select=select.format(row="OLD", sign=-1).strip())
+
+        # An update is the old row going away and the new one coming in.
+        for event, body in (("INSERT", add), ("DELETE", remove),
+                            ("UPDATE", remove + add)):
+            statements.append(
+                "CREATE TRIGGER IF NOT EXISTS summary_%s_%s AFTER %s ON %s\n"
+                "BEGIN%sEND" % (table.lower(), event.lower(), event, table,
+                                body))
+    return statements
+
+# The whole summary from scratch: the same joins as interviews.sql, but grouped
+# by contest without Contests (which report() looks names up in).
+REBUILD = """
+DELETE FROM Contest_Summary;
+INSERT INTO Contest_Summary
+SELECT
+    Colleges.contest_id
+    ,IFNULL(SUM(SubStats.total_submissions), 0)
+    ,IFNULL(SUM(SubStats.total_accepted_submissions), 0)
+    ,IFNULL(SUM(ViewStats.total_views), 0)
+    ,IFNULL(SUM(ViewStats.total_unique_views), 0)
+FROM
+    Colleges
+    INNER JOIN Challenges ON Colleges.college_id = Challenges.college_id
+    LEFT JOIN (
+      SELECT
+        challenge_id
+        ,SUM(total_views) as total_views
+        ,SUM(total_unique_views) as total_unique_views
+      FROM View_Stats
+      GROUP BY challenge_id
+    ) AS ViewStats ON Challenges.challenge_id = ViewStats.challenge_id
+    LEFT JOIN (
+      SELECT
+        challenge_id
+        ,SUM(total_submissions) as total_submissions
+        ,SUM(total_accepted_submissions) as total_accepted_submissions
+      FROM Submission_Stats
+      GROUP BY challenge_id
+    ) AS SubStats ON Challenges.challenge_id = SubStats.challenge_id
+GROUP BY
+    Colleges.contest_id;
+"""
+
+REPORT = """
+SELECT
+    Contests.*
+    ,Contest_Summary.total_submissions
+    ,Contest_Summary.total_accepted_submissions
+    ,Contest_Summary.total_views
+    ,Contest_Summary.total_unique_views
+FROM
+    Contest_Summary
+    INNER JOIN Contests ON Contest_Summary.contest_id = Contests.contest_id
+WHERE
+    Contest_Summary.total_views > 0
+    OR Contest_Summary.total_unique_views > 0
+    OR Contest_Summary.total_submissions > 0
+    OR Contest_Summary.total_accepted_submissions > 0
+ORDER BY
+    Contests.contest_id
+"""
+
+def statements(script):
+    r"""
+    Splits a script without triggers in it into its statements.
+
+    Test:
+    >>> statements("CREATE TABLE t (x INT);\n\nDELETE FROM t;\n")
+    ['CREATE TABLE t (x INT)', 'DELETE FROM t']
+    """
+
+    return [statement.strip() for statement in script.split(";")
+            if statement.strip()]
+
+def install(db):
+    """
+    Adds the summary table and its triggers to a database with the interviews
+    tables in it, and fills the summary in from whatever's already there.
+
+    Test:
+    >>> import sql_bench
+    >>> db = sqlite3.connect(":memory:")
+    >>> sql_bench.interviews_sample(db)
+    >>> install(db)
+    >>> for row in report(db):
+    ...     print(*row)
+    66406 17973 Rose 111 39 156 56
+    66556 79153 Angela 0 0 11 10
+    94828 80275 Frank 150 38 41 15
+
+    It all goes in at once, or not at all.
+    >>> db = sqlite3.connect(":memory:")
+    >>> sql_bench.interviews_sample(db)
+    >>> _ = db.execute("DROP TABLE Submission_Stats")
+    >>> install(db)
+    Traceback (most recent call last):
+      ...
+    sqlite3.OperationalError: no such table: main.Submission_Stats
+    >>> db.execute("SELECT name FROM sqlite_master "
+    ...            "WHERE name LIKE 'summary%' OR name = 'Contest_Summary'").fetchall()
+    []
+    """
+
+    # executescript() would commit as it went, so each statement is run on its
+    # own inside one transaction.  sqlite3 only opens one by itself before
+    # changes to rows, not before a CREATE, so it's opened here.
+    with db:
+        if not db.in_transaction:
+            db.execute("BEGIN")
+        for statement in statements(SUMMARY_SCHEMA) + triggers():
+            db.execute(statement)
+        rebuild(db)
+
+def rebuild(db):
+    """
+    Recomputes the summary from all of the stats, for if it's ever in doubt
+    (say, the tables were bulk loaded with the triggers dropped).
+    """
+
+    for statement in statements(REBUILD):
+        db.execute(statement)
+
+def ingest(db, view_stats=(), submission_stats=()):
+    """
+    Adds a batch of (challenge_id, total_views, total_unique_views) and
+    (challenge_id, total_submissions, total_accepted_submissions) rows, in one
+    transaction.  The triggers take care of the summary.
+
+    Test:
+    >>> import sql_bench
+    >>> db = sqlite3.connect(":memory:")
+    >>> sql_bench.interviews_sample(db)
+    >>> install(db)
+    >>> ingest(db, view_stats=[(60292, -11, -10)])
+    >>> [row[0] for row in report(db)]
+    [66406, 94828]
+    >>> ingest(db, submission_stats=[(60292, 3, 1)])
+    >>> report(db)[1]
+    (66556, 79153, 'Angela', 3, 1, 0, 0)
+
+    NULLs count for nothing, as they do in the query's SUMs.
+    >>> ingest(db, view_stats=[(47127, None, 3)],
+    ...        submission_stats=[(72974, None, None)])
+    >>> _ = db.execute("UPDATE View_Stats SET total_views = NULL "
+    ...                "WHERE challenge_id = 18765")
+    >>> report(db) == db.execute(sql_bench.read_query("interviews.sql")).fetchall()
+    True
+    >>> report(db)[0]
+    (66406, 17973, 'Rose', 111, 39, 41, 59)
+    """
+
+    with db:
+        db.executemany("INSERT INTO View_Stats VALUES (?, ?, ?)", view_stats)
+        db.executemany("INSERT INTO Submission_Stats VALUES (?, ?, ?)",
+                       submission_stats)
+
+def report(db):
+    """
+    Returns the rows of the interviews report, read from the summary.
+
+    Test:
+    Every kind of change, checked against the full query.
+    >>> import random, sql_bench
+    >>> db = sqlite3.connect(":memory:")
+    >>> rng = random.Random(25)
+    >>> sql_bench.interviews_data(db, 2000, rng)
+    >>> install(db)
+    >>> full = sql_bench.read_query("interviews.sql")
+    >>> changes = [
+    ...     "DELETE FROM View_Stats WHERE rowid % 7 = 0",
+    ...     "UPDATE Submission_Stats SET total_submissions = 0 "
+    ...     "WHERE rowid % 3 = 0",
+    ...     "UPDATE Challenges SET college_id = college_id + 1 "
+    ...     "WHERE challenge_id % 5 = 0",
+    ...     "INSERT INTO Challenges SELECT challenge_id + 1000, college_id "
+    ...     "FROM Challenges WHERE challenge_id < 100",
+    ...     "DELETE FROM Colleges WHERE college_id % 4 = 0",
+    ...     "UPDATE Colleges SET contest_id = 1 WHERE college_id % 9 = 0",
+    ...     "INSERT INTO Colleges SELECT college_id, contest_id + 1 "
+    ...     "FROM Colleges WHERE college_id < 10",
+    ...     "UPDATE View_Stats SET total_views = 0, total_unique_views = 0",
+    ... ]
+    >>> for change in changes:
+    ...     _ = db.execute(change)
+    ...     assert report(db) == db.execute(full).fetchall(), change
+    >>> len(report(db)) > 0
+    True
+    """
+
+    return db.execute(REPORT).fetchall()
+
+def main(argv):
+    """
+    Compares rerunning the full query after each ingest with keeping the
+    summary, on generated data of rows rows with batches of batch more.
+    """
+
+    import random
+    import sql_bench
+
+    rows = int(argv[0]) if argv else 10**5
+    batch = int(argv[1]) if len(argv) > 1 else 1000
+
+    rng = random.Random(sql_bench.SEED)
+    db = sqlite3.connect(":memory:")
+    sql_bench.interviews_data(db, rows, rng)
+    challenges = db.execute("SELECT MAX(challenge_id) FROM Challenges")
+    challenges = challenges.fetchone()[0]
+    full = sql_bench.read_query("interviews.sql")
+
+    start = time.perf_counter()
+    install(db)
+    print("install: %10.1fms" % ((time.perf_counter() - start) * 1000))
+
+    for _ in range(3):
+        view_stats = [(rng.randint(1, challenges), rng.randrange(100),
+                       rng.randrange(50)) for _ in range(batch)]
+        submission_stats = [(rng.randint(1, challenges), rng.randrange(100),
+                             rng.randrange(40)) for _ in range(batch)]
+
+        start = time.perf_counter()
+        ingest(db, view_stats, submission_stats)
+        ingested = time.perf_counter()
+        summarized = report(db)
+        reported = time.perf_counter()
+        expected = db.execute(full).fetchall()
+        queried = time.perf_counter()
+
+        print("ingest %d: %10.1fms  report: %8.1fms  full query: %8.1fms  %s"
+              % (2 * batch, (ingested - start) * 1000,
+                 (reported - ingested) * 1000, (queried - reported) * 1000,
+                 "matches" if summarized == expected else "MISMATCH"))
+        if summarized != expected:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
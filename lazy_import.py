@@ -0,0 +1,36 @@
+# ########################################################################### #
+# Importing NumPy takes longer than most of the solvers take to run, and most
+# runs never touch it.  lazy_import hands back a module which only actually
+# gets imported the first time one of its attributes is used.
+# ########################################################################### #
+
+
+import importlib.util
+import sys
+
+def lazy_import(name):
+    """
+    Returns the named module, to be imported on first use, or None if it isn't
+    installed.
+
+    Test:
+    >>> lazy_import("not_a_real_module") is None
+    True
+    >>> lazy_import("json").dumps([1])
+    '[1]'
+    """
+
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+
+    # This is the recipe from the importlib docs.
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -49,6 +49,41 @@
 import sys
 import re
 import io
+import itertools
+import timeit
+import functools
+
+from lazy_import import lazy_import
+from fast_input import read_input, split_header, lines
+import result_cache
+import instrument
+
+# NumPy is optional, it's only needed for the "numpy" engine.  It's only imported
+# once it's actually used, since that takes longer than most solves.
+np = lazy_import("numpy")
+
+# The problem's alphanumerics, which aren't the same as regex's \w
+ALNUM = r"[A-Za-z0-9]"
+
+# Symbols or spaces which sit between two alphanumerics.  See Solver.decode_loop
+# for how this pattern came about.  It's compiled once here since it's the same
+# for every matrix.
+SYMBOLS_BETWEEN_ALNUM = re.compile(
+    r"(?<=%s)[\s!@#$%%&]+(?=%s)" % (ALNUM, ALNUM))
+
+@functools.lru_cache()
+def byte_tables():
+    """
+    Returns lookup tables from a byte to whether it's alphanumeric, and to
+    whether it's one of the symbols/spaces that SYMBOLS_BETWEEN_ALNUM collapses.
+    """
+
+    is_alnum = np.zeros(256, dtype=bool)
+    is_alnum[[ord(c) for c in
+              "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"]] = True
+    is_symbol = np.zeros(256, dtype=bool)
+    is_symbol[[ord(c) for c in " \t\n\r\f\v\x1c\x1d\x1e\x1f!@#$%&"]] = True
+    return is_alnum, is_symbol
 
 class Solver:
     def __init__(self):
@@ -80,17 +115,59 @@ class Solver:
         >>> cleanup()
         """
 
-        stdin = sys.stdin
+        data = read_input()
 
-        self.N, self.M = map(int, next(stdin).split())
+        (self.N, self.M), offset = split_header(data)
 
-        self.matrix = list(map(lambda str: str.strip('\n'), stdin))
+        # Decoding the rows all at once and splitting them with one call is
+        # much quicker than stripping them a line at a time.
+        self.matrix = lines(data[offset:].decode())
 
-    def solve(self, matrix=None):
+    @classmethod
+    def from_buffer(cls, data):
+        r"""
+        Parses the raw bytes of an input into N and M, and keeps the matrix as
+        an (N, M) uint8 array viewing the rows inside of data.  No row gets
+        copied, the newlines are just stepped over.
+
+        Requires NumPy.
+
+        The lines can end in "\r\n" rather than "\n", as long as they all do.
+
+        Test:
+        >>> s = Solver.from_buffer(b"4 3\nwic\noto\nwso\n $l")
+        >>> s.N, s.M
+        (4, 3)
+        >>> np is None or s.matrix.tobytes() == b"wicotowso $l"
+        True
+        >>> s = Solver.from_buffer(b"2 3\r\nwic\r\noto\r\n")
+        >>> np is None or s.matrix.tobytes() == b"wicoto"
+        True
+        """
+
+        header, _, body = data.partition(b"\n")
+        N, M = map(int, header.split())
+        newline = b"\r\n" if header.endswith(b"\r") else b"\n"
+        stride = M + len(newline)
+
+        # Every row is M characters plus a newline, except possibly the last.
+        # Pad out the missing newline so everything has the same stride.
+        if len(body) < N * stride:
+            body = body + newline
+
+        solver = cls.__new__(cls)
+        solver.N, solver.M = N, M
+        solver.matrix = np.frombuffer(
+            body, dtype=np.uint8, count=N * stride).reshape(N, stride)[:, :M]
+        return solver
+
+    def solve(self, matrix=None, engine="transpose"):
         r"""
         Decodes a matrix using the instructions specified by the problem and
         returns the decoded message.
 
+        The engine picks which decode_* method does the work.
+
         Test:
         >>> matrix = [
         ... "f5i",
@@ -104,11 +181,61 @@ class Solver:
         >>> s.M = 3
         >>> s.solve(matrix)
         'f p 35 lim  $'
+        >>> s.solve(matrix, engine="loop")
+        'f p 35 lim  $'
+
+        With caching on, a grid is looked up without copying it out.
+        >>> cache = result_cache.configure()
+        >>> data = b"5 3\n" + b"\n".join(row.encode() for row in matrix)
+        >>> np is None or [Solver.from_buffer(data).solve(engine="numpy")
+        ...                for _ in "ab"]
+        ['f p 35 lim  $', 'f p 35 lim  $']
+        >>> np is None or (cache.hits, cache.misses) == (1, 1)
+        True
+        >>> result_cache.disable()
         """
 
         if matrix is None:
             matrix = self.matrix
 
+        def decode():
+            instrument.count("matrix-script.characters",
+                             len(matrix) * len(matrix[0]) if len(matrix) else 0)
+            return getattr(self, "decode_" + engine)(matrix)
+
+        if not result_cache.enabled():
+            return decode()
+
+        # Every engine gives the same answer, so the rows are all that goes
+        # into the key.  Rows never contain newlines, so joining them with one
+        # keeps different matrices apart.
+        if isinstance(matrix, list):
+            return result_cache.cached(
+                "matrix-script", "\n".join(matrix), decode)
+
+        # A grid from from_buffer is a view of the input with the newlines
+        # sliced off.  Rather than copying it out, the whole span of memory it
+        # covers (newlines and all) is hashed where it is, with the shape and
+        # row stride in the name so that only identical layouts share a key.
+        rows, columns = matrix.shape
+        stride = matrix.strides[0]
+        if rows and matrix.strides[1] == 1 and stride >= columns:
+            span = np.lib.stride_tricks.as_strided(
+                matrix, shape=((rows - 1) * stride + columns,), strides=(1,))
+        else:
+            span, stride = np.ascontiguousarray(matrix), columns
+        return result_cache.cached(
+            "matrix-script.grid %dx%d/%d" % (rows, columns, stride), span,
+            decode)
+
+    def decode_loop(self, matrix):
+        """
+        Decodes a matrix by reading it a character at a time.
+
+        This is quadratic in the size of the matrix since the string is built
+        up with +=, so it's only kept around as the readable version.
+        """
+
         # It'll be easiest to first read our matrix column-wise and concatenate
         # the columns into a single string.  Once we do that, decoding becomes
         # trivial.
@@ -164,9 +291,299 @@ class Solver:
 
         return decoded_string
 
+    def decode_transpose(self, matrix):
+        """
+        Decodes a matrix by letting zip do the column-wise read.
+
+        Going back to the zip idea in decode_loop, zip(*matrix) hands back the
+        columns as tuples of characters, and chaining them together gives the
+        whole column-wise reading in one join.  All of the per-character work
+        happens in C, and there's no string being rebuilt on every step, so
+        this is linear in N*M.
+
+        Test:
+        >>> s = Solver.__new__(Solver)
+        >>> s.decode_transpose(["Tsi", "h%x", "i #", "sM ", "$a ", "#t%", "ir!"])
+        'This is Matrix#  %!'
+        """
+
+        encoded_string = ''.join(itertools.chain.from_iterable(zip(*matrix)))
+
+        decoded_string, matches = SYMBOLS_BETWEEN_ALNUM.subn(' ', encoded_string)
+        instrument.count("matrix-script.matches", matches)
+        return decoded_string
+
+    def decode_numpy(self, matrix):
+        """
+        Decodes a matrix as an array of bytes, without ever looking at a
+        character from Python.
+
+        The matrix can be the (N, M) uint8 array made by from_buffer, or a
+        list of row strings.  Requires NumPy.
+
+        Test:
+        >>> matrix = ["Tsi", "h%x", "i #", "sM ", "$a ", "#t%", "ir!"]
+        >>> s = Solver.__new__(Solver)
+        >>> np is None or s.decode_numpy(matrix) == s.decode_transpose(matrix)
+        True
+        >>> np is None or s.decode_numpy(["@a", "!b", "# "]) == "@!#ab "
+        True
+        >>> np is None or s.decode_numpy(["$%", "!&"]) == "$!%&"
+        True
+        """
+
+        if not isinstance(matrix, np.ndarray):
+            matrix = np.frombuffer(
+                ''.join(matrix).encode('latin-1'), dtype=np.uint8
+            ).reshape(len(matrix), -1)
+
+        # Transposing is just swapping the strides, the ravel does the one
+        # actual copy into column-wise order.
+        encoded = matrix.T.ravel()
+        is_alnum, is_symbol = byte_tables()
+        alnum = is_alnum[encoded]
+        symbol = is_symbol[encoded]
+
+        # Just like the regex, look at each maximal run of symbols and only
+        # collapse it if there's an alphanumeric on both sides.
+        before = np.concatenate(([False], symbol[:-1]))
+        after = np.concatenate((symbol[1:], [False]))
+        starts = np.flatnonzero(symbol & ~before)
+        ends = np.flatnonzero(symbol & ~after)
+
+        collapse = np.zeros(len(starts), dtype=bool)
+        inside = (starts > 0) & (ends < len(encoded) - 1)
+        collapse[inside] = (
+            alnum[starts[inside] - 1] & alnum[ends[inside] + 1])
+
+        # A collapsed run keeps its first byte (as a space) and drops the rest.
+        # Marking +1 at each start and -1 past each end, a cumulative sum is 1
+        # exactly on the bytes of collapsed runs.
+        marks = np.zeros(len(encoded) + 1, dtype=np.int8)
+        marks[starts[collapse]] += 1
+        marks[ends[collapse] + 1] -= 1
+        in_run = np.cumsum(marks[:-1], dtype=np.int8).astype(bool)
+
+        if instrument.enabled():
+            instrument.count("matrix-script.matches", int(collapse.sum()))
+
+        decoded = encoded.copy()
+        decoded[starts[collapse]] = ord(' ')
+        keep = ~in_run
+        keep[starts[collapse]] = True
+
+        return decoded[keep].tobytes().decode('latin-1')
+
+# ########################################################################### #
+# Streaming decode
+#
+# Some scripts are too big to hold in memory, even as a single buffer.  Since
+# every row is exactly M characters (plus a newline), the ith character of
+# column c always sits at the same offset in the file, so the column-wise read
+# can be done straight out of a memory map with strided slices.
+#
+# The catch is the collapsing.  Whether a run of symbols turns into a space
+# depends on the character *after* the run, which might be in a tile we haven't
+# read yet.  So a run that touches the end of a tile is remembered only by its
+# offsets, and once we know what follows it we either write a space or re-read
+# it from the file.  Either way nothing bigger than a tile is held in memory.
+# ########################################################################### #
+
+# The most bytes of the column-wise reading held in memory at once.
+TILE_SIZE = 2**20
+
+IS_ALNUM_BYTE = frozenset(
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789")
+
+# Same patterns as above, but over bytes.  Bytes \s doesn't include the
+# \x1c-\x1f separators that str \s does, so they're spelled out.
+SYMBOLS_BETWEEN_ALNUM_BYTES = re.compile(
+    rb"(?<=[A-Za-z0-9])[\s\x1c-\x1f!@#$%&]+(?=[A-Za-z0-9])")
+LEADING_SYMBOLS = re.compile(rb"[\s\x1c-\x1f!@#$%&]+")
+TRAILING_SYMBOLS = re.compile(rb"[\s\x1c-\x1f!@#$%&]+\Z")
+
+def encoded_tiles(mm, base, N, M, start, stop, tile_size=TILE_SIZE,
+                  stride=None):
+    r"""
+    Yields the column-wise reading of the matrix between positions start and
+    stop, in pieces of at most tile_size bytes.
+
+    Position p of the reading is row p % N of column p // N, which lives at
+    offset base + (p % N) * stride + p // N of the file.  The stride is M + 1,
+    or M + 2 if the lines end in "\r\n".
+
+    Test:
+    >>> data = b"3 2\nab\ncd\nef\n"
+    >>> b"".join(encoded_tiles(data, 4, 3, 2, 0, 6))
+    b'acebdf'
+    >>> list(encoded_tiles(data, 4, 3, 2, 1, 5, tile_size=2))
+    [b'ce', b'bd']
+
+    A column taller than a tile is read a tile at a time, too.
+    >>> tall = b"10 2\n" + b"".join(b"%d%d\n" % (i, 9 - i) for i in range(10))
+    >>> tiles = list(encoded_tiles(tall, 5, 10, 2, 0, 20, tile_size=3))
+    >>> [len(tile) for tile in tiles]
+    [3, 3, 3, 1, 3, 3, 3, 1]
+    >>> b"".join(tiles)
+    b'01234567899876543210'
+    """
+
+    if stride is None:
+        stride = M + 1
+    # None of them, if a single column doesn't fit in a tile.
+    columns_per_tile = tile_size // N
+
+    p = start
+    while p < stop:
+        column, row = divmod(p, N)
+        whole_columns = min(columns_per_tile, (stop - p) // N)
+
+        if row == 0 and whole_columns:
+            # Every column is a single strided slice.
+            end = base + N * stride
+            yield b"".join(
+                mm[base + c:end + c:stride]
+                for c in range(column, column + whole_columns)
+            )
+            p += whole_columns * N
+        else:
+            # Otherwise just read down the rest of this column, or as much of
+            # it as fits in a tile.
+            rows = min(N - row, tile_size, stop - p)
+            offset = base + row * stride + column
+            yield mm[offset:offset + rows * stride:stride]
+            p += rows
+
+def stream_decode(path, out, tile_size=TILE_SIZE):
+    r"""
+    Decodes the matrix in the file at path, writing the decoded bytes to the
+    binary stream out.  The output is exactly Solver.solve() encoded.  The
+    lines can end in "\r\n" rather than "\n", as long as they all do.
+
+    Test:
+    >>> import os, tempfile
+    >>> with tempfile.NamedTemporaryFile(delete=False) as f:
+    ...     _ = f.write(b"7 3\nTsi\nh%x\ni #\nsM \n$a \n#t%\nir!")
+    >>> out = io.BytesIO()
+    >>> stream_decode(f.name, out, tile_size=2)
+    >>> out.getvalue()
+    b'This is Matrix#  %!'
+    >>> with open(f.name, "wb") as f:
+    ...     _ = f.write(b"7 3\r\nTsi\r\nh%x\r\ni #\r\nsM \r\n$a \r\n#t%\r\nir!\r\n")
+    >>> out = io.BytesIO()
+    >>> stream_decode(f.name, out, tile_size=2)
+    >>> out.getvalue()
+    b'This is Matrix#  %!'
+    >>> os.remove(f.name)
+    """
+
+    with read_input(path) as mm:
+        (N, M), base = split_header(mm)
+        if not N or not M:
+            return
+        stride = M + 2 if mm[base - 2:base] == b"\r\n" else M + 1
+
+        # The symbol run hanging off the end of the last tile, as
+        # (start, stop, whether an alphanumeric came right before it).
+        pending = None
+
+        def resolve(followed_by_alnum):
+            start, stop, preceded_by_alnum = pending
+            if preceded_by_alnum and followed_by_alnum:
+                out.write(b" ")
+            else:
+                for tile in encoded_tiles(
+                        mm, base, N, M, start, stop, tile_size, stride):
+                    out.write(tile)
+
+        g = 0
+        previous = b""
+        for tile in encoded_tiles(
+                mm, base, N, M, 0, N * M, tile_size, stride):
+            pos = 0
+
+            # A run hanging off the last tile might carry on into this one.
+            if pending is not None:
+                run = LEADING_SYMBOLS.match(tile)
+                if run:
+                    pending = (pending[0], g + run.end(), pending[2])
+                    pos = run.end()
+
+                if pos < len(tile):
+                    resolve(tile[pos] in IS_ALNUM_BYTE)
+                    pending = None
+                    previous = tile[pos - 1:pos]
+
+            # And a run at the end of this tile might carry on into the
+            # next one, so it's held back.
+            run = TRAILING_SYMBOLS.search(tile, pos)
+            cut = run.start() if run else len(tile)
+
+            # Everything in between can be handed to the regex, along with
+            # the byte before it so that the lookbehind can see it.  That
+            # byte is never a symbol, so the regex leaves it alone.
+            if pos < cut:
+                body = SYMBOLS_BETWEEN_ALNUM_BYTES.sub(
+                    b" ", previous + tile[pos:cut])
+                out.write(body[len(previous):])
+                previous = tile[cut - 1:cut]
+
+            if run:
+                pending = (
+                    g + cut, g + len(tile),
+                    previous[-1:] != b"" and previous[-1] in IS_ALNUM_BYTE,
+                )
+            g += len(tile)
+
+        # Nothing follows a run at the very end.
+        if pending is not None:
+            resolve(False)
+
+def benchmark(sizes=(10, 40, 160, 640), engines=("loop", "transpose", "numpy")):
+    """
+    Times each engine on square N x N matrices and prints the time per cell.
+    If an engine is linear in N*M then its time per cell should stay flat.
+    """
+
+    if np is None:
+        engines = [engine for engine in engines if engine != "numpy"]
+
+    s = Solver.__new__(Solver)
+    row = "ab c!@#d9"
+    for n in sizes:
+        matrix = [(row * (n // len(row) + 1))[:n] for _ in range(n)]
+        s.N = s.M = n
+
+        for engine in engines:
+            runs, seconds = timeit.Timer(
+                lambda: getattr(s, "decode_" + engine)(matrix)).autorange()
+            print("%-10s N=M=%-6d %8.1f ns/cell" % (
+                engine, n, seconds / runs / (n * n) * 1e9))
+
+def main(argv=()):
+    """
+    Decodes the matrix on stdin, or with --stream FILE decodes FILE without
+    loading it, or with --benchmark times the engines.
+    """
+
+    if "--benchmark" in argv:
+        benchmark()
+    elif argv[:1] == ["--stream"]:
+        with instrument.phase("solve"):
+            stream_decode(argv[1], sys.stdout.buffer)
+            sys.stdout.buffer.write(b"\n")
+    else:
+        with instrument.phase("parse"):
+            solver = Solver()
+        with instrument.phase("solve"):
+            answer = solver.solve()
+        with instrument.phase("emit"):
+            print(answer)
+
 if __name__ == "__main__":
-    import doctest
-    doctest.testmod()
+    # The doctests only run for a plain run of the script.
+    if not sys.argv[1:]:
+        import doctest
+        doctest.testmod()
 
-    solver = Solver()
-    print(solver.solve())
+    main(sys.argv[1:])
@@ -74,10 +74,98 @@
 # For purposes of parsing and solving the problem
 import sys
 import itertools
+import bisect
+import math
+import concurrent.futures
 # For purposes of testing the code
 import io
 
+from lazy_import import lazy_import
+from fast_input import read_input
+import result_cache
+import instrument
+
+# NumPy is optional, it only speeds up the exhaustive search.  It's only
+# imported once it's actually used, since that takes longer than most solves.
+np = lazy_import("numpy")
+
+# Combination sums are kept below 2m in int64, so m has to leave room for that.
+NUMPY_MAX_MODULUS = 2**62
+
+# Below this much brute force work, importing NumPy costs more than it saves.
+NUMPY_MIN_WORK = 2**17
+
+# The most combination sums that the NumPy engine holds in memory at once.
+NUMPY_CHUNK_SIZE = 2**20
+
+# Pairing up one set bit in Python costs about as much as shifting this many
+# digits of a Python int, which is what the incremental queries compare.
+PAIRING_COST = 120
+
+
+# ########################################################################### #
+# Choices of f
+#
+# The problem fixes f(x) = x^2, but nothing about the engines depends on that.
+# All they need is f(x) % m for every element, so each f is written as a
+# function of (x, m) which returns that residue directly.  That way we never
+# build x^2 (or worse, x^3) for an x near 1e9 just to throw most of it away.
+# ########################################################################### #
+
+def square(x, m):
+    return pow(x, 2, m)
+
+def power(e):
+    """
+    Returns f(x) = x^e reduced mod m.
+
+    Test:
+    >>> power(3)(10**9, 7) == (10**9)**3 % 7
+    True
+    """
+
+    def f_mod(x, m):
+        return pow(x, e, m)
+    return f_mod
+
+def polynomial(coefficients):
+    """
+    Returns the polynomial with the given coefficients (highest power first)
+    evaluated with Horner's method, reducing mod m after every step.
+
+    Test:
+    >>> polynomial([2, 0, 1])(10**9, 1000) == (2 * (10**9)**2 + 1) % 1000
+    True
+    """
+
+    def f_mod(x, m):
+        x %= m
+        r = 0
+        for c in coefficients:
+            r = (r * x + c) % m
+        return r
+    return f_mod
+
+F_MOD = {
+    "square": square,
+    "cube": power(3),
+}
+
+def register_f(name, f_mod):
+    """
+    Makes an f available to Solver.use_f by name.  f_mod(x, m) has to return
+    f(x) % m.
+    """
+
+    F_MOD[name] = f_mod
+
+
 class Solver:
+    # f(x) reduced mod m, and optional per-list weights w_i so that
+    # S = (w_1 f(x_1) + ... + w_k f(x_k)) % m
+    f_mod = staticmethod(square)
+    weights = None
+
     def __init__(self):
         r"""
         Reads from stdin and parses the inputs.
@@ -102,25 +190,31 @@ class Solver:
         >>> cleanup()
         """
 
-        stdin = sys.stdin
+        # Everything is read and converted to ints in one go, rather than a
+        # line at a time.
+        numbers = list(map(int, read_input().split()))
 
         # Extracting k and m from the first line of input.
-        self.k, self.m = map(int, next(stdin).strip().split())
+        self.k, self.m = numbers[:2]
 
-        #! IMPORTANT: We don't need the lengths of the lists for any reason, so
-        #  we are just ignoring the first integer on each line after the first.
-        self.lists = [
-            list(map(int, line.strip().split()[1:]))
-            for line in stdin
-        ]
+        #! IMPORTANT: Since the lines are gone, the lengths of the lists are
+        #  what tell us where each list ends.
+        self.lists = []
+        i = 2
+        for _ in range(self.k):
+            n = numbers[i]
+            self.lists.append(numbers[i + 1:i + 1 + n])
+            i += 1 + n
 
 
     def f(self, x):
-        return x**2
+        return self.f_mod(x, self.m)
 
     # Let X be a list where X_i is the element picked from the ith list.
     def s(self, X):
-        return sum(map(self.f, X)) % self.m
+        return sum(
+            self.residue(i, x) for i, x in enumerate(X)
+        ) % self.m
 
     def s_post_f(self, X):
         """
@@ -129,7 +223,153 @@ class Solver:
         return sum(X) % self.m
 
 
+    def use_f(self, f_mod, weights=None):
+        """
+        Switches to a different f, given either by name or as an f_mod(x, m)
+        function, and optionally weights the ith list by weights[i].
+
+        Test:
+        >>> s = Solver.from_lists(1000, [[5, 4], [7, 8, 9], [5, 7, 8, 9, 10]])
+        >>> s.use_f("cube")
+        >>> s.solve(), s.solve_brute_force()
+        (980, 980)
+        >>> s.use_f(polynomial([1, 0, 0]), weights=[3, 1, 2])
+        >>> s.solve(), s.solve_brute_force()
+        (356, 356)
+        >>> s.witness()
+        [5, 9, 10]
+        """
+
+        if isinstance(f_mod, str):
+            f_mod = F_MOD[f_mod]
+        self.f_mod = f_mod
+        self.weights = weights
+
+        # Everything cached was computed with the old f.
+        self.__dict__.pop("_residue_cache", None)
+        self.__dict__.pop("_pivot", None)
+
+    def residue(self, i, x):
+        """
+        Returns the contribution of picking x from the ith list, mod m.
+        """
+
+        weight = self.weights[i] if self.weights else 1
+        return weight * self.f_mod(x, self.m) % self.m
+
+    def list_residues(self, i):
+        """
+        Returns the sorted, distinct residues of the ith list.
+
+        These are cached per list index, so every engine shares them, and
+        there's never more than one entry per list however many edits a long
+        running incremental solver sees.  An entry is only good for the list
+        object it was made from (and the same m and weight), so replacing a
+        list, or all of self.lists, is enough to miss it.  The edit methods
+        drop or move the entries for the lists they touch.
+
+        Test:
+        >>> s = Solver.from_lists(10, [[1, 2, 11], [3]])
+        >>> s.list_residues(0), s.list_residues(1)
+        ([1, 4], [9])
+        >>> for x in range(100):
+        ...     s.replace_list(0, [x])
+        ...     _ = s.list_residues(0)
+        >>> len(s._residue_cache), s.list_residues(0)
+        (2, [1])
+        """
+
+        weight = self.weights[i] if self.weights else 1
+        lst = self.lists[i]
+
+        cache = self.__dict__.setdefault("_residue_cache", {})
+        entry = cache.get(i)
+        if (entry is None or entry[:2] != (self.m, weight)
+                or entry[2] is not lst):
+            residues = sorted({self.residue(i, x) for x in lst})
+            entry = cache[i] = (self.m, weight, lst, residues)
+        return entry[3]
+
+    def residue_table(self):
+        """
+        Returns list_residues for every list.
+        """
+
+        return [self.list_residues(i) for i in range(len(self.lists))]
+
     def solve(self):
+        """
+        Finds the maximum value of S as defined in the problem, picking
+        whichever engine should be cheapest for the shape of the input.
+
+        Test:
+        >>> s = Solver.__new__(Solver)
+        >>> s.k = 3
+        >>> s.m = 1000
+        >>> s.lists = [[5, 4], [7, 8, 9], [5, 7, 8, 9, 10]]
+        >>> s.solve()
+        206
+        >>> s.m = 999999937
+        >>> s.lists = [list(range(10**8, 10**8 + 40)) for _ in range(4)]
+        >>> s.pick_engine() == s.solve_meet_in_the_middle
+        True
+        >>> s.solve()
+        920007804
+        """
+
+        if not result_cache.enabled():
+            return self._solve()
+
+        # The answer only depends on m and which residues each list can
+        # contribute, so instances that agree on those (whatever f, the order
+        # of the lists, or repeated elements) share a cached result.
+        normalized = repr((self.m, sorted(map(tuple, self.residue_table()))))
+        return result_cache.cached("maximize-it", normalized, self._solve)
+
+    def _solve(self):
+        engine = self.pick_engine()
+        instrument.count("maximize-it.engine." + engine.__name__)
+        return engine()
+
+    def pick_engine(self):
+        """
+        Returns the engine which should be cheapest.  See engine_costs.
+        """
+
+        return min(self.engine_costs(), key=lambda cost: cost[0])[1]
+
+    def engine_costs(self):
+        """
+        Estimates the work done by each engine, as (cost, engine) pairs.
+
+        - Brute force looks at every one of the P combinations, k at a time.
+        - The residue bitset shifts an m-bit number once per element.
+        - Meet in the middle enumerates and sorts both halves, ~sqrt(P) each.
+        """
+
+        sizes = [len(lst) for lst in self.lists]
+        half = len(sizes) // 2
+
+        # Python ints shift 30 bits per digit, so an m-bit shift is ~m/30.
+        brute_force = math.prod(sizes) * len(sizes)
+        exhaustive = self.solve_brute_force
+        if (np is not None and self.m < NUMPY_MAX_MODULUS
+                and brute_force > NUMPY_MIN_WORK):
+            # Vectorized adds are roughly 50x cheaper than a Python-level sum.
+            brute_force //= 50
+            exhaustive = self.solve_numpy
+        residues = sum(sizes) * (self.m // 30 + 1)
+        left = min(math.prod(sizes[:half]), self.m)
+        right = min(math.prod(sizes[half:]), self.m)
+        meet = (left + right) * max(1, math.log2(right + 1))
+
+        return [
+            (brute_force, exhaustive),
+            (residues, self.solve_residues),
+            (meet, self.solve_meet_in_the_middle),
+        ]
+
+    def solve_brute_force(self):
         """
         Finds the maximum value of S as defined in the problem by brute force
         checking every possible combination of elements.
@@ -139,7 +379,7 @@ class Solver:
         >>> s.k = 3
         >>> s.m = 1000
         >>> s.lists = [[5, 4], [7, 8, 9], [5, 7, 8, 9, 10]]
-        >>> s.solve()
+        >>> s.solve_brute_force()
         206
         """
         
@@ -149,22 +389,762 @@ class Solver:
         # this to make sure we can handle summing and applying modulo to
         # potentially large numbers.
         #
-        # First we apply the function as defined in the problem, f(x) = x^2
-        fx_lists = [map(self.f, lst) for lst in self.lists]
-        mod_lists = [map(lambda x: x % self.m, lst) for lst in fx_lists]
+        # First we apply the function as defined in the problem, f(x) = x^2,
+        # which the residue table has already done (and reduced) for us.
+        mod_lists = self.residue_table()
 
         # Since we have an arbitrary number of lists ∈ [1, 7] then let's just
         # use itertools to get all of the possible combinations of elements
         # i.e. Cartesian products
         all_combinations_iter = itertools.product(*mod_lists)
+        instrument.count("maximize-it.tuples",
+                         math.prod(map(len, mod_lists)))
 
         s_max = max(map(self.s_post_f, all_combinations_iter))
 
         return s_max
 
+    def solve_residues(self):
+        """
+        Finds the maximum value of S by folding one list at a time into the
+        set of residues mod m which are reachable so far.
+
+        The reachable set is kept as a bitset (a Python int of m bits) where
+        bit r is set if some choice of elements from the lists folded so far
+        sums to r mod m.
+
+        Test:
+        >>> s = Solver.__new__(Solver)
+        >>> s.k = 3
+        >>> s.m = 1000
+        >>> s.lists = [[5, 4], [7, 8, 9], [5, 7, 8, 9, 10]]
+        >>> s.solve_residues()
+        206
+        >>> s.m = 1
+        >>> s.solve_residues()
+        0
+        >>> s.m = 7
+        >>> s.lists = [[1], [3, 2], [5]]
+        >>> s.solve_residues() == s.solve_brute_force()
+        True
+        """
+
+        # Going back to my note at the top, we have no way of knowing which
+        # element to pick without looking at the other choices.  But we don't
+        # actually care *which* choices got us to a sum, only which residues
+        # are possible.  There are only m of those, no matter how many
+        # combinations there are.
+        #
+        # So, start with only the residue 0 reachable (we haven't picked
+        # anything yet) and for each list, shift the reachable set by every
+        # residue in that list.  Shifting a bitset by r mod m is just a
+        # rotation of the bits.
+        m = self.m
+        full = (1 << m) - 1
+        top = 1 << (m - 1)
+
+        reachable = 1
+        table = self.residue_table()
+        last = len(table) - 1
+        for i, residues in enumerate(table):
+            # The table has no duplicate residues, which would shift the
+            # bitset the same way twice.
+            instrument.count("maximize-it.shifts", len(residues))
+
+            shifted = 0
+            for r in residues:
+                shifted |= ((reachable << r) | (reachable >> (m - r))) & full
+
+                # Nothing beats m-1, so once it's reachable on the last list
+                # we're done.  (Before the last list it doesn't mean much,
+                # since every later list will shift it again.)
+                if shifted & top and i == last:
+                    return m - 1
+            reachable = shifted
+
+            # However, if *every* residue is reachable, then shifting can't
+            # change that and m-1 will still be reachable at the end.
+            if reachable == full:
+                return m - 1
+
+        return reachable.bit_length() - 1
+
+    def solve_numpy(self, chunk_size=NUMPY_CHUNK_SIZE):
+        """
+        Finds the maximum value of S by checking every possible combination of
+        elements, like solve_brute_force, but with NumPy doing the sums.
+
+        Requires NumPy.
+
+        Test:
+        >>> s = Solver.__new__(Solver)
+        >>> s.k = 3
+        >>> s.m = 1000
+        >>> s.lists = [[5, 4], [7, 8, 9], [5, 7, 8, 9, 10]]
+        >>> np is None or s.solve_numpy() == 206
+        True
+        >>> np is None or s.solve_numpy(chunk_size=4) == 206
+        True
+        """
+
+        m = self.m
+        residues = self.residue_table()
+
+        # Build every combination sum of the first few lists with broadcast
+        # adds, stopping before the next outer sum would go past chunk_size.
+        prefix = np.zeros(1, dtype=np.int64)
+        split = 0
+        for lst in residues:
+            if prefix.size * len(lst) > chunk_size and split:
+                break
+            prefix = (prefix[:, None] + np.array(lst, dtype=np.int64)).ravel()
+            prefix %= m
+            split += 1
+
+        # The rest of the lists are walked a combination at a time, but each
+        # combination only costs one vectorized add over the whole prefix.
+        s_max = 0
+        visited = 0
+        for rest in itertools.product(*residues[split:]):
+            offset = sum(rest) % m
+            s_max = max(s_max, int(((prefix + offset) % m).max()))
+            visited += 1
+
+            if s_max == m - 1:
+                break
+
+        instrument.count("maximize-it.tuples", visited * prefix.size)
+        return s_max
+
+    def half_sums(self, table):
+        """
+        Returns the sorted residues mod m of every way to pick one residue from
+        each of the given lists of residues.
+
+        Test:
+        >>> s = Solver.__new__(Solver)
+        >>> s.m = 10
+        >>> s.half_sums([[1, 4], [9]])
+        [0, 3]
+        >>> s.half_sums([])
+        [0]
+        """
+
+        m = self.m
+        sums = {0}
+        for residues in table:
+            sums = {(a + r) % m for a in sums for r in residues}
+        return sorted(sums)
+
+    def solve_meet_in_the_middle(self):
+        """
+        Finds the maximum value of S by splitting the lists into two halves,
+        enumerating the residues each half can reach, and pairing them up.
+
+        This never builds anything of size m, so it's the engine for when the
+        modulus is huge but the lists aren't.
+
+        Test:
+        >>> s = Solver.__new__(Solver)
+        >>> s.k = 3
+        >>> s.m = 1000
+        >>> s.lists = [[5, 4], [7, 8, 9], [5, 7, 8, 9, 10]]
+        >>> s.solve_meet_in_the_middle()
+        206
+        >>> s.lists = [[10]]
+        >>> s.solve_meet_in_the_middle()
+        100
+        """
+
+        table = self.residue_table()
+        half = len(table) // 2
+        left = self.half_sums(table[:half])
+        right = self.half_sums(table[half:])
+        instrument.count("maximize-it.half_sums", len(left) + len(right))
+
+        # Both sides are already reduced mod m, so a + b < 2m and there are
+        # only two candidates for the best partner of a:
+        #
+        # - The largest b with a + b < m, which doesn't wrap around.  This is
+        #   found by binary searching for m - a.
+        # - The largest b overall, which wraps around to a + b - m.  This can
+        #   only be better if nothing fits below m - a.
+        m = self.m
+        best_right = right[-1]
+        s_max = 0
+        for a in left:
+            i = bisect.bisect_left(right, m - a)
+            if i:
+                s_max = max(s_max, a + right[i - 1])
+            else:
+                s_max = max(s_max, (a + best_right) % m)
+
+            if s_max == m - 1:
+                break
+
+        return s_max
+
+    # ####################################################################### #
+    # Incremental solving
+    #
+    # When only one list changes between queries, most of the work done by
+    # solve_residues is still good.  If we remember the reachable residues of
+    # every prefix lists[:i] and every suffix lists[i:], then an edit to list
+    # j only needs prefix[j], the new list j, and suffix[j+1] to answer.
+    #
+    # Everything on the far side of the edit (prefixes past j, suffixes before
+    # j+1) is thrown away and only rebuilt if a later edit or witness needs it.
+    # Repeatedly editing the same list costs O(m * n_j) for the new prefix,
+    # plus combining the two sides, which is never more than folding the lists
+    # after j back in.
+    #
+    # That's only a win when solve_residues is the engine we'd pick anyway.
+    # With m near 1e9 each of those bitsets is over a hundred megabytes (and
+    # with m = 2**40 they don't fit at all), while meet in the middle answers
+    # in a millisecond.  So unless engine_costs says the residues are the
+    # cheapest, no bitsets get built: query just calls solve, and witness
+    # walks back through the half sums that meet in the middle pairs up.
+    # ####################################################################### #
+
+    @classmethod
+    def from_lists(cls, m, lists=()):
+        """
+        Builds a solver from a modulus and lists instead of from stdin.
+
+        Test:
+        >>> s = Solver.from_lists(100, [[8, 12], [3]])
+        >>> s.k, s.m, s.lists
+        (2, 100, [[8, 12], [3]])
+        """
+
+        solver = cls.__new__(cls)
+        solver.m = m
+        solver.lists = [list(lst) for lst in lists]
+        solver.k = len(solver.lists)
+        return solver
+
+    def fold_residues(self, reachable, residues):
+        """
+        Returns the bitset of residues reachable after adding one of the
+        given residues on top of the reachable bitset.
+
+        Test:
+        >>> s = Solver.from_lists(10)
+        >>> bin(s.fold_residues(0b1, [1, 4]))
+        '0b10010'
+        >>> bin(s.fold_residues(0b10010, [9]))
+        '0b1001'
+        """
+
+        instrument.count("maximize-it.shifts", len(residues))
+
+        m = self.m
+        full = (1 << m) - 1
+        shifted = 0
+        for r in residues:
+            shifted |= ((reachable << r) | (reachable >> (m - r))) & full
+        return shifted
+
+    def _reset_incremental(self, pivot):
+        """
+        Drops every cached prefix past pivot and every suffix before pivot+1.
+        """
+
+        if not hasattr(self, "_pivot"):
+            self._prefix = [1]
+            self._suffix = [1]
+
+        self._pivot = max(pivot, 0)
+        self._prefix = self._prefix[:self._pivot + 1]
+        self._suffix = self._suffix[:max(self.k - self._pivot, 1)]
+
+    def _incremental(self):
+        """
+        Makes sure that the caches exist and reach the pivot from both sides.
+
+        self._prefix[i] is the bitset for lists[:i] (up to and including the
+        pivot list), while self._suffix is stored from the end, so
+        self._suffix[-1 - i] is the bitset for lists[self.k - i:].  Storing
+        suffixes from the end means that they don't move when a list is added
+        or removed after them.
+        """
+
+        if not hasattr(self, "_pivot"):
+            self._pivot = max(self.k - 1, 0)
+            self._prefix = [1]
+            self._suffix = [1]
+
+        while len(self._prefix) <= min(self._pivot + 1, self.k):
+            i = len(self._prefix) - 1
+            self._prefix.append(
+                self.fold_residues(self._prefix[-1], self.list_residues(i)))
+
+        while len(self._suffix) < self.k - self._pivot:
+            i = self.k - len(self._suffix)
+            self._suffix.append(
+                self.fold_residues(self._suffix[-1], self.list_residues(i)))
+
+    def add_list(self, lst, weight=1):
+        """
+        Adds a list to the end of the lists, weighted by weight if use_f set
+        up weights.
+
+        Test:
+        >>> s = Solver.from_lists(1000, [[5, 4], [7, 8, 9]])
+        >>> s.query()
+        106
+        >>> s.add_list([5, 7, 8, 9, 10])
+        >>> s.query()
+        206
+        """
+
+        self.lists.append(list(lst))
+        if self.weights:
+            self.weights = list(self.weights) + [weight]
+        self.k += 1
+        self._reset_incremental(self.k - 1)
+
+    def replace_list(self, i, lst):
+        """
+        Replaces the ith list.
+
+        Test:
+        >>> s = Solver.from_lists(1000, [[5, 4], [7, 8, 9], [5]])
+        >>> s.replace_list(2, [5, 7, 8, 9, 10])
+        >>> s.query()
+        206
+        >>> s.replace_list(0, [30])
+        >>> s.query()
+        998
+        """
+
+        self.lists[i] = list(lst)
+        self.__dict__.get("_residue_cache", {}).pop(i % self.k, None)
+        self._reset_incremental(i % self.k)
+
+    def remove_list(self, i):
+        """
+        Removes the ith list.
+
+        Test:
+        >>> s = Solver.from_lists(1000, [[5, 4], [30], [7, 8, 9]])
+        >>> s.query()
+        997
+        >>> s.remove_list(1)
+        >>> s.query()
+        106
+        >>> s.remove_list(0)
+        >>> s.remove_list(0)
+        >>> s.query()
+        0
+        """
+
+        i %= self.k
+
+        # Lists before i keep their prefixes and lists after i keep their
+        # suffixes, so the pivot moves to whichever side is still around.
+        del self.lists[i]
+        cache = self.__dict__.get("_residue_cache", {})
+        self._residue_cache = {
+            j - (j > i): entry for j, entry in cache.items() if j != i}
+        if self.weights:
+            self.weights = self.weights[:i] + self.weights[i + 1:]
+        self.k -= 1
+        self._reset_incremental(i - 1 if i == self.k else i)
+
+    @staticmethod
+    def set_bits(x):
+        """
+        Returns the positions of the set bits of x, lowest first.
+
+        Scanning for the ones in bin(x) happens in C, so this only does Python
+        work for the bits which are set.
+
+        Test:
+        >>> Solver.set_bits(0b101001), Solver.set_bits(1 << 1000)
+        ([0, 3, 5], [1000])
+        >>> Solver.set_bits(0)
+        []
+        """
+
+        digits = bin(x)
+        top = len(digits) - 1
+        bits = []
+        i = digits.find("1", 2)
+        while i != -1:
+            bits.append(top - i)
+            i = digits.find("1", i + 1)
+        bits.reverse()
+        return bits
+
+    def _sides(self):
+        """
+        Returns the bitsets for lists[:pivot+1] and lists[pivot+1:].
+        """
+
+        self._incremental()
+        if not self.k:
+            return 1, 1
+        return self._prefix[self._pivot + 1], self._suffix_at(self._pivot + 1)
+
+    def _best(self, left, right):
+        """
+        Returns the best (a + b) % m for a residue a reachable in left and b
+        reachable in right.
+
+        There are three ways of getting it, and this picks whichever should be
+        cheapest for how many residues each side has:
+
+        - Pair up the set bits of both sides, like solve_meet_in_the_middle.
+          That's Python work for every reachable residue.
+        - Shift the denser side by every set bit of the sparser one.
+        - Fold the lists after the pivot back in, one shift per residue, which
+          is never more work than solve_residues.
+        """
+
+        m = self.m
+        p, q = left.bit_count(), right.bit_count()
+
+        # With more residues between the two sides than there are residues,
+        # for every t some a and t-a line up, so m-1 is reachable.
+        if p + q > m:
+            return m - 1
+
+        shift = m // 30 + 1
+        after = [self.list_residues(i) for i in range(self._pivot + 1, self.k)]
+        refold = sum(map(len, after)) * shift
+        spread = min(p, q) * shift
+        # Writing a side out in binary costs about as much as ten shifts.
+        pairs = (p + q) * PAIRING_COST + 20 * shift
+
+        if refold <= min(spread, pairs):
+            for residues in after:
+                left = self.fold_residues(left, residues)
+            return left.bit_length() - 1
+
+        if spread <= pairs:
+            if p < q:
+                left, right = right, left
+            reachable = self.fold_residues(left, self.set_bits(right))
+            return reachable.bit_length() - 1
+
+        instrument.count("maximize-it.pairs", p + q)
+        left = self.set_bits(left)
+        right = self.set_bits(right)
+
+        # Without wrapping around, the best partner for a is the biggest b
+        # below m-a, and as a goes up that only moves down.
+        best = -1
+        j = len(right) - 1
+        for a in left:
+            while j >= 0 and a + right[j] >= m:
+                j -= 1
+            if j < 0:
+                break
+            if a + right[j] > best:
+                best = a + right[j]
+
+        # Wrapping around, the biggest of both is best.
+        return max(best, (left[-1] + right[-1]) % m)
+
+    def _pair(self, left, right, t):
+        """
+        Returns (a, b) for a residue a reachable in left and b reachable in
+        right with (a + b) % m == t, which must be possible.
+
+        Test:
+        >>> s = Solver.from_lists(10)
+        >>> s._pair(0b1010, 0b10100, 7)
+        (3, 4)
+        """
+
+        # Reversing right's m bits puts b at bit m-1-b.  Rotating that down by
+        # m-1-t then puts b at bit t-b, which lines up with a.
+        m = self.m
+        flipped = int(format(right, "0%db" % m)[::-1], 2)
+        s = m - 1 - t
+        rotated = ((flipped >> s) | (flipped << (m - s))) & ((1 << m) - 1)
+        a = (left & rotated).bit_length() - 1
+        return a, (t - a) % m
+
+    def _bitsets(self):
+        """
+        Returns whether the incremental bitsets are worth keeping, which is
+        when solve_residues is the cheapest engine for the current lists.
+        """
+
+        return self.pick_engine() == self.solve_residues
+
+    def query(self):
+        """
+        Returns the maximum value of S for the current lists.
+
+        Test:
+        Once the sides around it are built, editing one list should fold in
+        fewer residues than solving from scratch, even when m-1 can't be
+        reached (all of the squares are multiples of 4) and nothing stops
+        early.
+        >>> import random
+        >>> rng = random.Random(4)
+        >>> def even_list():
+        ...     return [2 * rng.randrange(1, 10**8) for _ in range(20)]
+        >>> s = Solver.from_lists(10**4, [even_list() for _ in range(7)])
+        >>> s.pick_engine() == s.solve_residues
+        True
+        >>> def shifts(edit):
+        ...     with instrument.collect() as stats:
+        ...         edit()
+        ...     return stats["counters"].get("maximize-it.shifts", 0)
+        >>> def edit(i):
+        ...     s.replace_list(i, even_list())
+        ...     return s.query()
+        >>> solve = shifts(s.solve_residues)
+        >>> for i in (0, 3, 6):
+        ...     _ = edit(i)
+        ...     print(shifts(lambda: edit(i)) < solve, edit(i) == s.solve())
+        True True
+        True True
+        True True
+
+        When the residues aren't the cheapest engine, neither is this, and
+        no m-bit bitsets get built at all.
+        >>> s = Solver.from_lists(2**40, [list(range(1, 8))] * 7)
+        >>> s.replace_list(3, [10**6])
+        >>> s.query() == s.solve_meet_in_the_middle(), s._prefix, s._suffix
+        (True, [1], [1])
+        """
+
+        if not self._bitsets():
+            return self.solve()
+        return self._best(*self._sides())
+
+    def witness(self):
+        """
+        Returns one element picked from each list that achieves query().
+
+        Test:
+        >>> s = Solver.from_lists(1000, [[5, 4], [7, 8, 9], [5, 7, 8, 9, 10]])
+        >>> s.witness()
+        [5, 9, 10]
+        >>> s.replace_list(1, [7, 8])
+        >>> X = s.witness()
+        >>> s.s(X) == s.query() == s.solve_brute_force()
+        True
+        >>> s = Solver.from_lists(10**4, [range(2, 80, 4)] * 7)
+        >>> s._bitsets()
+        True
+        >>> s.replace_list(2, [10**5 + 1])
+        >>> X = s.witness()
+        >>> s.s(X) == s.query() == s.solve_meet_in_the_middle()
+        True
+        """
+
+        if not self._bitsets():
+            return self._half_witness()
+
+        left, right = self._sides()
+        a, b = self._pair(left, right, self._best(left, right))
+        m = self.m
+        picked = [None] * self.k
+        if not self.k:
+            return picked
+
+        # Walk backwards from the pivot, each time choosing an element which
+        # leaves a residue that the previous prefix could reach.
+        for i in range(self._pivot, -1, -1):
+            for x in self.lists[i]:
+                rest = (a - self.residue(i, x)) % m
+                if self._prefix[i] >> rest & 1:
+                    picked[i], a = x, rest
+                    break
+
+        # Suffixes need every one after the pivot, not just the next one.
+        for i in range(self._pivot + 1, self.k):
+            suffix = self._suffix_at(i + 1)
+            for x in self.lists[i]:
+                rest = (b - self.residue(i, x)) % m
+                if suffix >> rest & 1:
+                    picked[i], b = x, rest
+                    break
+
+        return picked
+
+    def _half_witness(self):
+        """
+        Same as witness, but from the half sums of solve_meet_in_the_middle
+        rather than from bitsets.
+        """
+
+        m = self.m
+        t = self.solve()
+        half = self.k // 2
+        left = self._half_prefixes(range(half))
+        right = self._half_prefixes(range(half, self.k))
+
+        # Some a from the left half has its partner t-a in the right half, and
+        # each half is walked back the same way as the bitset prefixes.
+        a = next(a for a in left[-1] if (t - a) % m in right[-1])
+        return (self._walk_back(range(half), left, a)
+                + self._walk_back(range(half, self.k), right, (t - a) % m))
+
+    def _half_prefixes(self, indices):
+        """
+        Returns the sets of residues reachable by each prefix of the lists at
+        indices, from the empty one up to all of them.
+        """
+
+        m = self.m
+        prefixes = [{0}]
+        for i in indices:
+            residues = self.list_residues(i)
+            prefixes.append(
+                {(a + r) % m for a in prefixes[-1] for r in residues})
+        return prefixes
+
+    def _walk_back(self, indices, prefixes, target):
+        """
+        Returns an element from each list at indices which together sum to
+        target, given their _half_prefixes.
+        """
+
+        indices = list(indices)
+        picked = [None] * len(indices)
+        for j in range(len(indices) - 1, -1, -1):
+            for x in self.lists[indices[j]]:
+                rest = (target - self.residue(indices[j], x)) % self.m
+                if rest in prefixes[j]:
+                    picked[j], target = x, rest
+                    break
+        return picked
+
+    def _suffix_at(self, i):
+        """
+        Returns the bitset for lists[i:], which must be after the pivot.
+        """
+
+        return self._suffix[self.k - i]
+
+
+# ########################################################################### #
+# Batch solving
+#
+# When there are thousands of instances to get through, starting a new process
+# (and running the doctests) for each one costs far more than solving it.  In
+# batch mode stdin is a stream of instances, one after another, each in the
+# same format as the problem input.  Unlike Solver.__init__, the batch parser
+# has to use k and n_i to know where each instance ends.
+# ########################################################################### #
+
+def parse_instances(data):
+    r"""
+    Splits a bytes stream of concatenated instances into (m, lists) pairs.
+
+    Test:
+    >>> list(parse_instances(b"2 100\n2 8 12\n1 3\n1 5\n3 1 2 3\n"))
+    [(100, [[8, 12], [3]]), (5, [[1, 2, 3]])]
+    """
+
+    tokens = data.split()
+    i = 0
+    while i < len(tokens):
+        k, m = int(tokens[i]), int(tokens[i + 1])
+        i += 2
+
+        lists = []
+        for _ in range(k):
+            n = int(tokens[i])
+            lists.append(list(map(int, tokens[i + 1:i + 1 + n])))
+            i += 1 + n
+
+        yield m, lists
+
+def solve_instance(instance):
+    """
+    Solves a single (m, lists) instance.  Lives at module level so that it can
+    be sent to worker processes.
+    """
+
+    m, lists = instance
+    return Solver.from_lists(m, lists).solve()
+
+def solve_batch(data, workers=None, chunksize=64):
+    r"""
+    Solves every instance in a bytes stream and returns the answers in input
+    order.  With workers=1 everything runs in this process.
+
+    Test:
+    >>> data = b"3 1000\n2 5 4\n3 7 8 9\n5 5 7 8 9 10\n2 100\n2 8 12\n1 3\n"
+    >>> solve_batch(data, workers=1)
+    [206, 73]
+    >>> solve_batch(data, workers=2, chunksize=1)
+    [206, 73]
+    """
+
+    instances = parse_instances(data)
+    if workers == 1:
+        return list(map(solve_instance, instances))
+
+    # Executor.map hands out instances in chunks and gives the results back
+    # in order, no matter which worker finishes first.
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(solve_instance, instances,
+                                 chunksize=chunksize))
+
+def cost(argv, data):
+    r"""
+    Estimates the work of solving the input data (given argv), in the units of
+    Solver.engine_costs.  The daemon uses this to keep big instances, which
+    can be only a few bytes long, off of its event loop.
+
+    Test:
+    >>> cost([], b"3 1000\n2 5 4\n3 7 8 9\n5 5 7 8 9 10\n") < 1000
+    True
+    >>> big = b"20 999999937\n" + b"7 1 2 3 4 5 6 7\n" * 20
+    >>> cost([], big) > 10**9
+    True
+    """
+
+    return sum(
+        min(engine_cost for engine_cost, _ in
+            Solver.from_lists(m, lists).engine_costs())
+        for m, lists in parse_instances(data)
+    )
+
+def main_batch(workers=None):
+    """
+    Reads concatenated instances from stdin and writes one answer per line.
+    """
+
+    with instrument.phase("parse"):
+        data = sys.stdin.buffer.read()
+    with instrument.phase("solve"):
+        answers = solve_batch(data, workers)
+    with instrument.phase("emit"):
+        sys.stdout.write("".join("%d\n" % answer for answer in answers))
+
+def main(argv=()):
+    """
+    Solves the instance on stdin, or with --batch every instance on stdin
+    (across --workers N processes, one per core by default).
+    """
+
+    if "--batch" in argv:
+        workers = None
+        if "--workers" in argv:
+            workers = int(argv[argv.index("--workers") + 1])
+        main_batch(workers)
+    else:
+        with instrument.phase("parse"):
+            solver = Solver()
+        with instrument.phase("solve"):
+            answer = solver.solve()
+        with instrument.phase("emit"):
+            print(answer)
+
 if __name__ == "__main__":
-    import doctest
-    doctest.testmod()
+    # The doctests only run for a plain run of the script.
+    if not sys.argv[1:]:
+        import doctest
+        doctest.testmod()
 
-    solver = Solver()
-    print(solver.solve())
\ No newline at end of file
+    main(sys.argv[1:])
@@ -82,6 +82,41 @@
 # I think this will work.
 # Still has a pretty bad runtime.
 
+import array
+import collections
+import concurrent.futures
+import io
+import itertools
+import os
+import sys
+
+from lazy_import import lazy_import
+from fast_input import read_input, lines
+import instrument
+
+# NumPy is optional, it's only needed for next_batch.  It's only imported
+# once it's actually used, since that takes longer than most solves.
+np = lazy_import("numpy")
+
+# The number of permutations enumerated (and written) at a time by write_all.
+RANGE_SIZE = 2**16
+
+# Factorials are used over and over for the multinomials, so they're cached as they're needed.
+_factorials = [1]
+
+def factorial(n: int) -> int:
+    while len(_factorials) <= n:
+        _factorials.append(_factorials[-1] * len(_factorials))
+    return _factorials[n]
+
+def multinomial(counts) -> int:
+    """ Returns the number of distinct permutations of a multiset with the given counts. """
+
+    total = factorial(sum(counts))
+    for count in counts:
+        total //= factorial(count)
+    return total
+
 class Solver:
     def __init__(self, string: str):
         self.string = string
@@ -111,6 +146,10 @@ class Solver:
 
             while switch > search:
                 if self.string[switch] > self.string[search]:
+                    # Iteration i makes i comparisons if it comes up empty, so that's
+                    # 0 + 1 + ... + (iteration - 1) before this one.
+                    instrument.count("next-lex-permutation.comparisons",
+                                     iteration * (iteration - 1) // 2 + self.length - switch)
                     return self.swap_string(search, switch)
 
                 # Otherwise, decrement switch to bring it closer to search
@@ -120,6 +159,7 @@ class Solver:
             # our iteration count and look for the next larger-separated pairs of switch and search.
 
         # If we iterated completely and didn't find anything, then there's no next permutation.
+        instrument.count("next-lex-permutation.comparisons", self.length * (self.length - 1) // 2)
         return False
 
     def swap_string(self, left, right):
@@ -191,8 +231,373 @@ class Solver:
                 # Now I just need to reverse the substring
                 return new_string[:sub_left] + new_string[sub_right:sub_left-1:-1]
 
-s = Solver("158476531")
-print(s.lex())
+    # Both of the above build a brand new string on every call, so stepping through a lot of
+    # permutations costs O(n) in copies per step even though most steps only touch the last
+    # couple of characters.  If the permutation lives in a mutable buffer instead, then the
+    # pivot, swap and reverse can all happen in place.
+
+    @staticmethod
+    def next_in_place(buffer) -> bool:
+        """
+        Rearranges buffer into its next lex-ordered permutation, in place.
+        Returns False (leaving buffer alone) if it's already the last one.
+
+        >>> buffer = bytearray(b"1442")
+        >>> Solver.next_in_place(buffer), buffer
+        (True, bytearray(b'2144'))
+        >>> Solver.next_in_place(bytearray(b"4421"))
+        False
+        """
+
+        # Walk left past the decreasing (well, non-increasing) suffix.  The character just
+        # before it is the pivot.
+        pivot = len(buffer) - 2
+        while pivot >= 0 and buffer[pivot] >= buffer[pivot + 1]:
+            pivot -= 1
+
+        if pivot < 0:
+            return False
+
+        # Swap the pivot with the rightmost character in the suffix that's larger than it.
+        # Taking the rightmost one keeps the suffix non-increasing even with repeats.
+        successor = len(buffer) - 1
+        while buffer[successor] <= buffer[pivot]:
+            successor -= 1
+        buffer[pivot], buffer[successor] = buffer[successor], buffer[pivot]
+
+        # And the suffix goes from largest to smallest, so reverse it.
+        buffer[pivot + 1:] = buffer[:pivot:-1]
+        return True
+
+    def permutations(self, string: str=None, copy: bool=False):
+        """
+        Yields the solver's string followed by every lex-ordered permutation after it.
+
+        The permutation is kept in a single bytearray (or an array of code points if the string
+        isn't latin-1), and that buffer itself is yielded every time, so it's only good until
+        the next step.  Amortized over all permutations, each step does O(1) work.  With
+        copy=True, each one is yielded as a new str instead, which costs O(n) a step.
+
+        >>> [bytes(p) for p in Solver("ab").permutations()]
+        [b'ab', b'ba']
+        >>> list(Solver("aab").permutations(copy=True))
+        ['aab', 'aba', 'baa']
+        >>> list(Solver("1€").permutations(copy=True))
+        ['1€', '€1']
+        """
+
+        if string:
+            self.__init__(string)
+
+        try:
+            buffer = bytearray(self.string, "latin-1")
+            to_str = lambda buffer: buffer.decode("latin-1")
+        except UnicodeEncodeError:
+            buffer = array.array("L", map(ord, self.string))
+            to_str = lambda buffer: "".join(map(chr, buffer))
+
+        while True:
+            yield to_str(buffer) if copy else buffer
+
+            if not Solver.next_in_place(buffer):
+                return
+
+    def next_permutation(self, string: str=None):
+        """
+        Returns the next lex-ordered permutation of the solver's string, or False if it's the
+        last one.
+
+        >>> Solver("114122").next_permutation()
+        '114212'
+        >>> Solver("4421").next_permutation()
+        False
+        """
+
+        if string:
+            self.__init__(string)
+
+        permutations = self.permutations(copy=True)
+        next(permutations)
+        following = next(permutations, False)
+
+        # The pivot is the first character that changed.  One swap puts its successor there,
+        # and everything after it gets reversed.
+        if following and instrument.enabled():
+            pivot = next(i for i, (a, b) in enumerate(zip(self.string, following)) if a != b)
+            instrument.count("next-lex-permutation.swaps")
+            instrument.count("next-lex-permutation.reversed", self.length - pivot - 1)
+        return following
+
+    # Stepping one permutation at a time is hopeless if we want the one a million steps from
+    # now.  Instead, we can count.  The permutations starting with a smaller first character all
+    # come before ours, and there are (n-1)! / (product of the remaining counts') of each.  Add
+    # those up for every position and that's the rank of a string among its permutations.
+    #
+    # With repeated characters it's the multinomial n! / (c_1! c_2! ... ) rather than n!, but
+    # the nice part is that it changes by a simple ratio as characters get used up:
+    # picking a character with count c out of r remaining scales the total by c / r.
+
+    @staticmethod
+    def _alphabet(string: str):
+        """ Returns the sorted distinct characters of string and how many of each there are. """
+
+        counts = collections.Counter(string)
+        alphabet = sorted(counts)
+        return alphabet, [counts[c] for c in alphabet]
+
+    def rank(self, string: str=None) -> int:
+        """
+        Returns how many distinct permutations of the string come before it.
+
+        >>> [Solver(p).rank() for p in ["aab", "aba", "baa"]]
+        [0, 1, 2]
+        >>> Solver("158476531").rank()
+        12239
+        """
+
+        if string:
+            self.__init__(string)
+
+        alphabet, counts = Solver._alphabet(self.string)
+        index = {c: i for i, c in enumerate(alphabet)}
+
+        # A Fenwick tree over the alphabet, so "how many remaining characters are smaller than
+        # this one" is O(log σ) rather than a walk over the alphabet.
+        tree = [0] * (len(alphabet) + 1)
+        for i, count in enumerate(counts):
+            j = i + 1
+            while j < len(tree):
+                tree[j] += count
+                j += j & -j
+
+        remaining = self.length
+        total = multinomial(counts)
+        rank = 0
+        for c in self.string:
+            i = index[c]
+
+            smaller = 0
+            j = i
+            while j:
+                smaller += tree[j]
+                j -= j & -j
+
+            # Each smaller character starts a block of total * count / remaining permutations,
+            # so together they're total * smaller / remaining.
+            rank += total * smaller // remaining
+
+            # Use up c.
+            total = total * counts[i] // remaining
+            counts[i] -= 1
+            remaining -= 1
+            j = i + 1
+            while j < len(tree):
+                tree[j] -= 1
+                j += j & -j
+
+        return rank
+
+    def unrank(self, rank: int, multiset: str=None) -> str:
+        """
+        Returns the permutation of the multiset's characters (the solver's string by default)
+        which has the given rank.  Returns False if there aren't that many permutations.
+
+        >>> s = Solver("aab")
+        >>> [s.unrank(r) for r in range(4)]
+        ['aab', 'aba', 'baa', False]
+        """
+
+        if multiset is None:
+            multiset = self.string
+
+        alphabet, counts = Solver._alphabet(multiset)
+        remaining = len(multiset)
+        total = multinomial(counts)
+        if not 0 <= rank < total:
+            return False
+
+        # The same blocks as in rank, but now we walk over them to find the one holding rank.
+        picked = []
+        while remaining:
+            for i, c in enumerate(alphabet):
+                block = total * counts[i] // remaining
+                if rank < block:
+                    break
+                rank -= block
+
+            picked.append(c)
+            total = block
+            counts[i] -= 1
+            remaining -= 1
+
+        return "".join(picked)
+
+    def advance(self, k: int, string: str=None) -> str:
+        """
+        Returns the lex-ordered permutation k steps after the solver's string, or False if there
+        isn't one.  This takes O(n * σ) no matter how big k is.
+
+        >>> Solver("158476531").advance(1)
+        '158513467'
+        >>> Solver("aab").advance(2), Solver("aab").advance(3)
+        ('baa', False)
+        """
+
+        if string:
+            self.__init__(string)
+
+        return self.unrank(self.rank() + k)
+
+    # When there are lots of equal-length strings to step forward once each, the per-string
+    # Python work (building a Solver, looping over characters) is what costs the most.  Since
+    # every step of next_in_place is a comparison, a search, a swap or a reversal, it can be
+    # done on all of the strings at once as rows of an array.
+
+    @staticmethod
+    def next_batch(strings):
+        """
+        Takes an (R, n) uint8 array of strings and returns (next, last) where next holds each
+        row's next lex-ordered permutation and last marks rows that were already the last
+        permutation (those rows are returned unchanged).  Requires NumPy.
+
+        >>> np is None or Solver.next_batch(np.array([list(b"1442"), list(b"4421")],
+        ...                                          dtype=np.uint8))[0].tobytes() == b"21444421"
+        True
+        >>> np is None or Solver.next_batch(np.array([list(b"aba"), list(b"baa")],
+        ...                                          dtype=np.uint8))[1].tolist() == [False, True]
+        True
+        """
+
+        strings = np.asarray(strings, dtype=np.uint8)
+        R, n = strings.shape
+        if n < 2:
+            return strings.copy(), np.ones(R, dtype=bool)
+
+        rows = np.arange(R)
+        columns = np.arange(n)
+
+        # The pivot is the last position that's smaller than the one after it.
+        increasing = strings[:, :-1] < strings[:, 1:]
+        last = ~increasing.any(axis=1)
+        pivot = n - 2 - np.argmax(increasing[:, ::-1], axis=1)
+        pivot[last] = n
+
+        # The successor is the rightmost character after the pivot that's larger than it.
+        pivot_value = strings[rows, np.minimum(pivot, n - 1)]
+        larger = (strings > pivot_value[:, None]) & (columns > pivot[:, None])
+        successor = n - 1 - np.argmax(larger[:, ::-1], axis=1)
+
+        swapped = strings.copy()
+        changing = rows[~last]
+        swapped[changing, pivot[changing]] = strings[changing, successor[changing]]
+        swapped[changing, successor[changing]] = strings[changing, pivot[changing]]
+
+        # Reversing the suffix is just reading it through mirrored indices.  For rows that were
+        # last, the pivot was set past the end so nothing gets mirrored.
+        mirrored = np.where(columns > pivot[:, None], n + pivot[:, None] - columns, columns)
+        return swapped[rows[:, None], mirrored], last
+
+    # With unrank, every permutation can be reached directly, so enumerating all of them splits
+    # up nicely: cut the ranks 0..total into contiguous ranges, unrank the start of each range,
+    # and step through the range in place.  Each range is independent, so they can go to
+    # different processes and come back in order.
+    #
+    # The ranges are a fixed number of ranks long rather than a fixed fraction of the total.
+    # With a dozen distinct characters, a quarter of the ranks per core would be tens of
+    # millions of lines in one buffer.  RANGE_SIZE lines are still a big write, and only a few
+    # ranges per worker are in flight at once, so memory stays bounded however many there are.
+
+    def write_all(self, out, workers: int=None, range_size: int=RANGE_SIZE):
+        """
+        Writes every distinct permutation of the solver's string to the binary stream out, one
+        per line, in lex order.  Ranges of range_size ranks are enumerated by a pool of worker
+        processes (or in this process if workers is 1), and each range is written with one call.
+
+        >>> out = io.BytesIO()
+        >>> Solver("baa").write_all(out, workers=1)
+        >>> out.getvalue()
+        b'aab\\naba\\nbaa\\n'
+        >>> parallel = io.BytesIO()
+        >>> Solver("baa").write_all(parallel, workers=2, range_size=2)
+        >>> parallel.getvalue() == out.getvalue()
+        True
+        """
+
+        multiset = "".join(sorted(self.string))
+        total = multinomial(Solver._alphabet(multiset)[1])
+        tasks = ((multiset, start, min(start + range_size, total))
+                 for start in range(0, total, range_size))
+
+        if workers == 1:
+            for task in tasks:
+                out.write(_enumerate_range(task))
+            return
+
+        workers = workers or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            pending = collections.deque()
+            for task in tasks:
+                pending.append(executor.submit(_enumerate_range, task))
+                if len(pending) >= 4 * workers:
+                    out.write(pending.popleft().result())
+
+            while pending:
+                out.write(pending.popleft().result())
+
+def _enumerate_range(task) -> bytes:
+    """ Returns the permutations with ranks start..stop of a multiset as utf-8 lines. """
+
+    multiset, start, stop = task
+    if start >= stop:
+        return b""
+    string = Solver(multiset).unrank(start)
+
+    # ASCII is already utf-8, so the buffer can go straight into the block without being
+    # decoded and encoded again.
+    if string.isascii():
+        block = bytearray()
+        permutations = Solver(string).permutations()
+        for buffer in itertools.islice(permutations, stop - start):
+            block += buffer
+            block += b"\n"
+        return bytes(block)
+
+    permutations = Solver(string).permutations(copy=True)
+    lines = list(itertools.islice(permutations, stop - start))
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+def main(argv=()):
+    """
+    Prints the next lex-ordered permutation of the string on stdin, or False.  With --all,
+    writes every permutation of it instead (across worker processes with --parallel, one per
+    core unless --workers N says otherwise).
+    """
+
+    with instrument.phase("parse"):
+        string = (lines(read_input()) or [b""])[0].decode()
+
+    if "--all" in argv:
+        workers = None if "--parallel" in argv else 1
+        if "--workers" in argv:
+            workers = int(argv[argv.index("--workers") + 1])
+        with instrument.phase("solve"):
+            Solver(string).write_all(sys.stdout.buffer, workers=workers)
+            sys.stdout.buffer.flush()
+        return
+
+    with instrument.phase("solve"):
+        answer = Solver(string).next_permutation()
+    with instrument.phase("emit"):
+        print(answer)
+
+if __name__ == "__main__":
+    # The doctests only run for a plain run of the script.
+    if not sys.argv[1:]:
+        import doctest
+        doctest.testmod()
+
+    main(sys.argv[1:])
 
 # Awesome!  Now what's this runtime like:
 #
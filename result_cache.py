@@ -0,0 +1,282 @@
+# ########################################################################### #
+# Caching results
+#
+# A lot of the inputs we get are ones we've already seen: the same maximize-it
+# instances, the same matrices.  The solvers which do enough work for it to pay
+# off look their input up here first.  (Postal codes and next permutations are
+# linear in their input, so hashing it would cost as much as solving it.)
+#
+# Caching is off until something turns it on with configure(), since the
+# hashing and pickling are wasted on inputs which never repeat.  The daemon
+# turns it on, and so does solve.py's --cache.
+#
+# Results are keyed by a hash of the solver's name and its normalized input,
+# which each solver builds so that inputs which can't have different answers
+# (say, maximize-it lists in a different order) share an entry.  The most
+# recently used results are kept in memory, up to a number of entries and a
+# number of bytes.  If $SOLVER_CACHE names a file, results are also kept there
+# in SQLite so that they survive restarts and can be shared between processes.
+# ########################################################################### #
+
+
+import collections
+import hashlib
+import os
+import pickle
+
+# Stands in for "not cached", since None and False are perfectly good results.
+MISSING = object()
+
+class ResultCache:
+    def __init__(self, max_entries=4096, max_bytes=2**24, path=None):
+        """
+        Produces:
+        self.entries := key => (size, result), least recently used first
+        self.hits, self.misses, self.evictions := Counters for sizing it
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.disk_hits = 0
+        self._db = None
+
+    @staticmethod
+    def key(solver, normalized):
+        """
+        Returns the key for a solver's normalized input, which can be a str
+        or anything that exposes a buffer (bytes, a NumPy array, ...).  Buffers
+        are hashed where they are, without a copy.
+
+        Test:
+        >>> key = ResultCache.key
+        >>> key("maximize-it", "abc") == key("maximize-it", b"abc")
+        True
+        >>> key("maximize-it", b"abc") == key("matrix-script", b"abc")
+        False
+        >>> key("maximize-it", memoryview(b"abc")) == key("maximize-it", "abc")
+        True
+        """
+
+        if isinstance(normalized, str):
+            normalized = normalized.encode()
+        digest = hashlib.sha256(solver.encode() + b"\0")
+        digest.update(normalized)
+        return digest.hexdigest()
+
+    def db(self):
+        """
+        Returns the connection to the on-disk store, opening it the first time.
+        """
+
+        if self._db is None:
+            import sqlite3
+
+            # Autocommit, with a generous timeout for when several processes
+            # are writing at once.
+            self._db = sqlite3.connect(self.path, timeout=30,
+                                       isolation_level=None,
+                                       check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS results "
+                             "(key TEXT PRIMARY KEY, value BLOB)")
+        return self._db
+
+    def get(self, key):
+        """
+        Returns the cached result for key, or MISSING.
+
+        Test:
+        >>> cache = ResultCache()
+        >>> cache.get("k") is MISSING
+        True
+        >>> cache.put("k", False)
+        >>> cache.get("k")
+        False
+        >>> cache.hits, cache.misses
+        (1, 1)
+        """
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key][1]
+
+        if self.path is not None:
+            row = self.db().execute(
+                "SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                result = pickle.loads(row[0])
+                self._remember(key, row[0], result)
+                return result
+
+        self.misses += 1
+        return MISSING
+
+    def put(self, key, result):
+        """
+        Caches result under key, evicting the least recently used results
+        until the cache is back under its limits.
+
+        Test:
+        >>> cache = ResultCache(max_entries=2)
+        >>> for key in "abc":
+        ...     cache.put(key, key.upper())
+        >>> list(cache.entries), cache.evictions
+        (['b', 'c'], 1)
+        >>> cache = ResultCache(max_bytes=100)
+        >>> cache.put("big", "x" * 1000)
+        >>> len(cache.entries), cache.bytes
+        (0, 0)
+        """
+
+        pickled = pickle.dumps(result)
+        self._remember(key, pickled, result)
+
+        if self.path is not None:
+            self.db().execute("INSERT OR REPLACE INTO results VALUES (?, ?)",
+                              (key, pickled))
+
+    def _remember(self, key, pickled, result):
+        # Something bigger than the whole cache would only push everything
+        # else out, so it's just not kept in memory.
+        size = len(key) + len(pickled)
+        if size > self.max_bytes or self.max_entries < 1:
+            return
+
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[0]
+        self.entries[key] = (size, result)
+        self.bytes += size
+
+        while (len(self.entries) > self.max_entries
+               or self.bytes > self.max_bytes):
+            self.bytes -= self.entries.popitem(last=False)[1][0]
+            self.evictions += 1
+
+    def lookup(self, solver, normalized, compute):
+        """
+        Returns the cached result for a solver's normalized input, calling
+        compute() for it (and caching that) if there isn't one.
+
+        Test:
+        >>> cache = ResultCache()
+        >>> calls = []
+        >>> def compute():
+        ...     calls.append(1)
+        ...     return 206
+        >>> cache.lookup("maximize-it", b"input", compute)
+        206
+        >>> cache.lookup("maximize-it", b"input", compute)
+        206
+        >>> len(calls)
+        1
+        """
+
+        key = self.key(solver, normalized)
+        result = self.get(key)
+        if result is MISSING:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def stats(self):
+        """
+        Returns the counters, along with how full the cache is.
+
+        Test:
+        >>> ResultCache().stats()["hit_rate"]
+        0.0
+        """
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
+
+    def clear(self):
+        """
+        Forgets everything, on disk too, and resets the counters.
+
+        Test:
+        >>> cache = ResultCache()
+        >>> cache.put("k", 1)
+        >>> cache.clear()
+        >>> cache.get("k") is MISSING, cache.bytes, cache.misses
+        (True, 0, 1)
+        """
+
+        self.entries.clear()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.disk_hits = 0
+        if self.path is not None:
+            self.db().execute("DELETE FROM results")
+
+# The cache every solver uses, or None while caching is off.
+CACHE = None
+
+# Where configure() keeps results on disk by default.
+DEFAULT_PATH = os.environ.get("SOLVER_CACHE")
+
+def enabled():
+    return CACHE is not None
+
+def configure(max_entries=4096, max_bytes=2**24, path=DEFAULT_PATH):
+    r"""
+    Turns caching on, replacing the shared cache if there already is one.  A
+    max_entries of 0 turns off the in-memory cache (the on-disk store, if
+    there's a path, still gets used).  Results are only kept on disk if
+    there's a path, which is $SOLVER_CACHE unless given.
+
+    Test:
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), "results.sqlite")
+    >>> cache = configure(path=path)
+    >>> cached("maximize-it", b"1 10\n1 3\n", lambda: 9)
+    9
+    >>> cache = configure(path=path)
+    >>> cached("maximize-it", b"1 10\n1 3\n", lambda: 0)
+    9
+    >>> cache.stats()["disk_hits"]
+    1
+    >>> disable()
+    """
+
+    global CACHE
+    CACHE = ResultCache(max_entries, max_bytes, path)
+    return CACHE
+
+def disable():
+    """
+    Turns caching off, so that cached() just computes.
+
+    Test:
+    >>> disable()
+    >>> cached("maximize-it", b"anything", lambda: 206)
+    206
+    >>> enabled()
+    False
+    """
+
+    global CACHE
+    CACHE = None
+
+def cached(solver, normalized, compute):
+    """
+    Looks a solver's normalized input up in the shared cache, or just calls
+    compute() if caching is off.  See ResultCache.lookup.
+    """
+
+    if CACHE is None:
+        return compute()
+    return CACHE.lookup(solver, normalized, compute)
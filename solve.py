@@ -0,0 +1,154 @@
+# ########################################################################### #
+# A single entry point for running any of the solvers.
+#
+# Running a solver's script directly also runs its doctests, which is nice
+# while working on it but a waste on every production run.  This only loads the one script it's asked for,
+# never runs the doctests unless given --test, and then hands the rest of the
+# arguments to that script's main().
+#
+# With --stats, the time spent in each phase and the work counters are printed
+# to stderr after the run.  --profile and --trace-memory add a cProfile report
+# and the peak memory traced.  --cache turns on the result cache, kept on disk
+# in $SOLVER_CACHE (if it's set) so that results last between runs.
+#
+# Usage:
+#   python solve.py SOLVER [ARGS...] < input
+#   python solve.py SOLVER [--stats] [--profile] [--trace-memory] < input
+#   python solve.py SOLVER --cache < input
+#   python solve.py SOLVER --test
+#   python solve.py --benchmark-startup
+# ########################################################################### #
+
+
+import os
+import sys
+
+import instrument
+import result_cache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Solver name => script.  The scripts have dashes in their names, so they
+# can't be imported normally and are loaded from their paths instead.
+SOLVERS = {
+    "binary-tree-nodes": "binary-tree-nodes.py",
+    "matrix-script": "matrix-script.py",
+    "maximize-it": "maximize-it.py",
+    "next-lex-permutation": "next-lex-permutation.py",
+    "validating-postal-codes": "validating-postal-codes.py",
+}
+
+# A small input for each solver, used by the startup benchmark.
+SAMPLE_INPUTS = {
+    "binary-tree-nodes": b"1,2\n3,2\n6,8\n9,8\n2,5\n8,5\n5,NULL\n",
+    "matrix-script": b"7 3\nTsi\nh%x\ni #\nsM \n$a \n#t%\nir!\n",
+    "maximize-it": b"3 1000\n2 5 4\n3 7 8 9\n5 5 7 8 9 10\n",
+    "next-lex-permutation": b"158476531\n",
+    "validating-postal-codes": b"110000\n",
+}
+
+def load(name):
+    """
+    Imports the script for the named solver and returns it as a module.  The
+    module is registered in sys.modules (with underscores in its name) so that
+    process pools can find its functions.
+    """
+
+    import importlib.util
+
+    module_name = name.replace("-", "_")
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    spec = importlib.util.spec_from_file_location(
+        module_name, os.path.join(HERE, SOLVERS[name]))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def benchmark_startup(runs=20):
+    """
+    Times running each solver on its sample input, both as a plain run of its
+    script (doctests and all) and through this entry point.
+    """
+
+    import subprocess
+    import time
+
+    def best_of(command, stdin):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, input=stdin, stdout=subprocess.DEVNULL,
+                           check=True)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    print("%-24s %10s %10s" % ("solver", "script", "solve.py"))
+    for name, script in SOLVERS.items():
+        stdin = SAMPLE_INPUTS[name]
+        direct = best_of([sys.executable, os.path.join(HERE, script)], stdin)
+        dispatched = best_of(
+            [sys.executable, os.path.abspath(__file__), name], stdin)
+        print("%-24s %8.1fms %8.1fms" % (
+            name, direct * 1000, dispatched * 1000))
+
+def report(stats, out=None):
+    """
+    Prints stats collected by instrument.collect in a readable form.
+
+    Test:
+    >>> report({"phases": {"parse": 0.0015}, "counters": {"work": 3},
+    ...         "peak_bytes": 2048}, sys.stdout)
+    phase parse                                               1.500ms
+    counter work                                                  3
+    peak memory                                                 2.0KiB
+    """
+
+    out = out or sys.stderr
+    for name, seconds in stats["phases"].items():
+        print("%-52s %10.3fms" % ("phase " + name, seconds * 1000), file=out)
+    for name, total in sorted(stats["counters"].items()):
+        print("%-52s %10d" % ("counter " + name, total), file=out)
+    if "peak_bytes" in stats:
+        print("%-52s %10.1fKiB" % ("peak memory", stats["peak_bytes"] / 1024),
+              file=out)
+    if "profile" in stats:
+        print(stats["profile"], file=out)
+
+def main(argv):
+    if argv[:1] == ["--benchmark-startup"]:
+        benchmark_startup()
+        return 0
+
+    if not argv or argv[0] not in SOLVERS:
+        print("usage: solve.py {%s} [--test | ARGS...]" % ",".join(SOLVERS),
+              file=sys.stderr)
+        return 2
+
+    module = load(argv[0])
+
+    if "--test" in argv[1:]:
+        import doctest
+        return doctest.testmod(module).failed and 1
+
+    flags = {"--stats", "--profile", "--trace-memory", "--cache"}
+    wanted = flags.intersection(argv[1:])
+    args = [arg for arg in argv[1:] if arg not in flags]
+
+    if "--cache" in wanted:
+        wanted.remove("--cache")
+        result_cache.configure()
+
+    if not wanted:
+        module.main(args)
+        return 0
+
+    with instrument.collect(report, profile="--profile" in wanted,
+                            trace_memory="--trace-memory" in wanted):
+        module.main(args)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
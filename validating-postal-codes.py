@@ -73,6 +73,35 @@
 
 import sys
 import re
+import io
+import collections
+import os
+import mmap
+import concurrent.futures
+import tempfile
+
+from lazy_import import lazy_import
+from fast_input import read_input
+import instrument
+
+# Both regex's are the same for every postal code, so they're compiled once
+# here rather than on every call to solve.
+regex_integer_in_range = re.compile(r"^[1-9]\d{5}$")
+
+# Matches a digit if there it is followed by any digit and then by
+# itself.  A positive lookahead is used so that only that first digit
+# gets consumed.
+#
+# Failure to use a lookahead will result in all involved digits being
+# consumed which in turn leads to overlapping matches not being counted
+regex_alternating_repetitive_digit_pair = re.compile(r"(?=(\d)\d\1)\d")
+
+# NumPy is optional, it's only needed for validate_array.  It's only imported
+# once it's actually used, since that takes longer than most solves.
+np = lazy_import("numpy")
+
+# How many bytes of stdin the streaming validator reads at a time.
+CHUNK_SIZE = 2**20
 
 class Solver:
     def __init__(self):
@@ -82,7 +111,7 @@ class Solver:
         Produces:
         self.P := The inputted postal code to be validated
         """
-        self.P = sys.stdin.read().strip()
+        self.P = read_input().decode().strip()
 
     def solve(self, P=None):
         """
@@ -112,28 +141,388 @@ class Solver:
         if P is None:
             P = self.P
 
-        regex_integer_in_range = r"^[1-9]\d{5}$"
+        # Provided in the writeup.
+        if not regex_integer_in_range.match(P):
+            return False
 
-        # Matches a digit if there it is followed by any digit and then by
-        # itself.  A positive lookahead is used so that only that first digit
-        # gets consumed.
-        #
-        # Failure to use a lookahead will result in all involved digits being
-        # consumed which in turn leads to overlapping matches not being counted
-        regex_alternating_repetitive_digit_pair = r"(?=(\d)\d\1)\d"
+        matches = len(regex_alternating_repetitive_digit_pair.findall(P))
+        instrument.count("validating-postal-codes.matches", matches)
+        return matches < 2
 
-        # Provided in the writeup.
-        valid = (
-          bool(re.match(regex_integer_in_range, P))
-          and
-          len(re.findall(regex_alternating_repetitive_digit_pair, P)) < 2
-        )
 
-        return valid
+# ########################################################################### #
+# Streaming validation
+#
+# For a feed of millions of postal codes, one per line, we don't need regex's
+# at all.  A valid code is exactly six ASCII digits without a leading zero, and
+# since the lookahead pattern consumes one digit at a time, the number of
+# matches it finds is just the number of positions i where P[i] == P[i+2].
+# ########################################################################### #
+
+def is_valid(P):
+    """
+    Checks a single postal code given as bytes, without any regex's.
+
+    Test:
+    >>> [is_valid(P) for P in [b"123456", b"121345", b"121343", b" 110000"]]
+    [True, True, False, False]
+    >>> [is_valid(P) for P in [b"012345", b"12345", b"1234567", b"12a456"]]
+    [False, False, False, False]
+    """
+
+    P = P.strip()
+    return (
+        len(P) == 6
+        and P.isdigit()
+        and P[0] != 48  # ord("0")
+        and (P[0] == P[2]) + (P[1] == P[3]) + (P[2] == P[4]) + (P[3] == P[5]) < 2
+    )
+
+def validate_lines(block, check=is_valid):
+    r"""
+    Validates every line of a block of bytes with check and returns one True
+    or False per line, newline terminated.
+
+    Test:
+    >>> validate_lines(b"123456\n110000\n")
+    b'True\nFalse\n'
+    """
+
+    lines = block.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+
+    return b"".join([b"True\n" if check(P) else b"False\n" for P in lines])
+
+def read_blocks(stream, chunk_size=CHUNK_SIZE):
+    r"""
+    Reads a binary stream chunk_size bytes at a time and yields blocks of
+    whole lines.  The partial line at the end of each chunk is carried over.
+
+    Test:
+    >>> list(read_blocks(io.BytesIO(b"123456\n110000\n9"), chunk_size=4))
+    [b'123456\n', b'110000\n', b'9']
+    """
+
+    carry = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        block = carry + chunk
+        cut = block.rfind(b"\n") + 1
+        if cut:
+            yield block[:cut]
+        carry = block[cut:]
+
+    if carry:
+        yield carry
+
+def stream_validate(stdin, stdout, chunk_size=CHUNK_SIZE, workers=1,
+                    check=is_valid):
+    r"""
+    Validates every line of the binary stream stdin, writing one True or False
+    line per postal code to the binary stream stdout.
+
+    With more than one worker, blocks are validated in a process pool.  Only a
+    few blocks per worker are in flight at once so memory stays bounded, and
+    results are written in input order.
+
+    Test:
+    >>> feed = b"123456\n121343\n  \n987654\n"
+    >>> out = io.BytesIO()
+    >>> stream_validate(io.BytesIO(feed), out, chunk_size=5)
+    >>> out.getvalue()
+    b'True\nFalse\nFalse\nTrue\n'
+    >>> parallel = io.BytesIO()
+    >>> stream_validate(io.BytesIO(feed), parallel, chunk_size=5, workers=2)
+    >>> parallel.getvalue() == out.getvalue()
+    True
+    """
+
+    blocks = read_blocks(stdin, chunk_size)
+    if workers == 1:
+        for block in blocks:
+            stdout.write(validate_lines(block, check))
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for block in blocks:
+            pending.append(executor.submit(validate_lines, block, check))
+            if len(pending) >= 4 * workers:
+                stdout.write(pending.popleft().result())
+
+        while pending:
+            stdout.write(pending.popleft().result())
+
+
+# ########################################################################### #
+# Validity bitmap
+#
+# There are only 900,000 codes in range (100000 to 999999), so whether each of
+# them is valid fits in a 112.5 KB bitmap.  It's built once by running solve on
+# every code (several seconds) and saved, and from then on memory mapped so
+# that checking a code is a parse to int and a single bit test.
+#
+# Building it is its own step, --build-bitmap, rather than something the first
+# --stream --bitmap run does behind your back.  That run might not be allowed
+# to write next to the script, and with --parallel every worker would be
+# building it at once.  The bitmap is mapped in the parent before any workers
+# start, so they share its pages.
+#
+# It isn't a speedup over is_valid, mind.  On 2M codes, is_valid takes about
+# 1.2s and the bitmap about 1.6s, since the int parse and the lookup cost more
+# than four byte comparisons.  It's kept for checks too costly to redo per code.
+# ########################################################################### #
+
+SMALLEST_CODE = 100000
+LARGEST_CODE = 999999
+
+# Next to the script, unless $POSTAL_CODE_BITMAP says otherwise (say, for an
+# install that can't be written to).
+BITMAP_PATH = os.environ.get("POSTAL_CODE_BITMAP", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "valid-postal-codes.bin"))
+
+def build_bitmap():
+    """
+    Runs solve on every code in range and returns a bytearray where bit i is
+    set if SMALLEST_CODE + i is valid.
+    """
+
+    solver = Solver.__new__(Solver)
+    bitmap = bytearray((LARGEST_CODE - SMALLEST_CODE) // 8 + 1)
+    for i in range(LARGEST_CODE - SMALLEST_CODE + 1):
+        if solver.solve(str(SMALLEST_CODE + i)):
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return bitmap
+
+def check_bitmap(bitmap):
+    """
+    Returns whether bitmap_valid agrees with solve on every code in range.
+    """
+
+    solver = Solver.__new__(Solver)
+    return all(
+        bitmap_valid(bitmap, b"%d" % P) == solver.solve(str(P))
+        for P in range(SMALLEST_CODE, LARGEST_CODE + 1)
+    )
+
+def save_bitmap(path=BITMAP_PATH):
+    """
+    Builds the bitmap, checks it, and writes it to path.
+    """
+
+    bitmap = build_bitmap()
+    if not check_bitmap(bitmap):
+        raise ValueError("bitmap does not agree with Solver.solve")
+
+    # Write to a temporary file first, so that nobody maps a half-written one.
+    # It gets a name of its own, so two builds at once can't write over each
+    # other's.
+    fd, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(bitmap)
+        # mkstemp makes it private to its owner, but anyone may read it.
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def load_bitmap(path=BITMAP_PATH):
+    """
+    Memory maps the bitmap at path, which save_bitmap (or --build-bitmap) must
+    have written already.
+    """
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            "no bitmap at %s, run validating-postal-codes.py --build-bitmap"
+            % path)
+
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def bitmap_valid(bitmap, P):
+    """
+    Checks a single postal code given as bytes by looking it up in bitmap.
+
+    Test:
+    >>> bitmap = bytearray(112500)
+    >>> bitmap[(123456 - SMALLEST_CODE) >> 3] = 1 << ((123456 - SMALLEST_CODE) & 7)
+    >>> [bitmap_valid(bitmap, P) for P in [b"123456", b"123457", b"012345", b"+12345"]]
+    [True, False, False, False]
+    """
+
+    P = P.strip()
+    if len(P) != 6 or not P.isdigit():
+        return False
+
+    i = int(P) - SMALLEST_CODE
+    return i >= 0 and bool(bitmap[i >> 3] >> (i & 7) & 1)
+
+_bitmap = None
+
+def use_bitmap(path=BITMAP_PATH):
+    """
+    Maps the bitmap at path for is_valid_bitmap to look codes up in, in this
+    process and in any workers forked from it afterwards.
+
+    Test:
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> use_bitmap(os.path.join(directory, "missing.bin"))  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    FileNotFoundError: no bitmap at ...
+    >>> os.rmdir(directory)
+    """
+
+    global _bitmap
+    _bitmap = load_bitmap(path)
+
+def is_valid_bitmap(P):
+    """
+    Same as is_valid, but looks codes up in the bitmap given to use_bitmap,
+    or if there wasn't one, the bitmap at BITMAP_PATH.  Either way it's
+    mapped once per process (or once in the parent, before the workers fork).
+    """
+
+    if _bitmap is None:
+        use_bitmap()
+    return bitmap_valid(_bitmap, P)
+
+def path_option(argv, name):
+    """
+    Returns the path following name in argv, or BITMAP_PATH if there isn't
+    one.
+
+    Test:
+    >>> path_option(["--bitmap", "codes.bin", "--stream"], "--bitmap")
+    'codes.bin'
+    >>> path_option(["--bitmap", "--stream"], "--bitmap") == BITMAP_PATH
+    True
+    """
+
+    following = argv[argv.index(name) + 1:][:1]
+    if following and not following[0].startswith("--"):
+        return following[0]
+    return BITMAP_PATH
+
+
+# ########################################################################### #
+# Vectorized validation
+#
+# For a whole column of codes at once, the same two checks from is_valid can
+# be done with array comparisons: a range check, and a row-wise count of the
+# positions where a digit matches the one two places later.
+# ########################################################################### #
+
+def validate_digits(digits):
+    """
+    Takes an (R, 6) array of digits and returns a boolean mask of which rows
+    are valid codes.  Requires NumPy.
+
+    Test:
+    >>> np is None or validate_digits([[1, 2, 1, 3, 4, 5], [0, 1, 2, 3, 4, 5],
+    ...                                [1, 2, 3, 4, 5, 10]]).tolist() == [
+    ...     True, False, False]
+    True
+    """
+
+    digits = np.asarray(digits)
+    if digits.ndim != 2 or digits.shape[1] != 6:
+        return np.zeros(len(digits), dtype=bool)
+
+    # Working a column at a time is quicker than reducing along axis 1.
+    columns = [digits[:, i] for i in range(6)]
+    in_range = columns[0] != 0
+    for column in columns:
+        in_range &= (column >= 0) & (column <= 9)
+
+    # Counting in int8 keeps the row-wise sum from widening to int64.
+    pairs = sum(
+        (columns[i] == columns[i + 2]).view(np.int8) for i in range(4))
+    return in_range & (pairs < 2)
+
+# The validity of every code in range, as a boolean array.  Built from
+# validate_digits the first time validate_array needs it.
+_valid_table = None
+
+def validate_array(codes):
+    """
+    Takes either an (R, 6) array of digits or an array of R integers and
+    returns a boolean mask of which codes are valid.  Requires NumPy.
+
+    Integers skip the digits altogether.  Once they're range checked, they're
+    looked up in a 900,000 entry table of which codes are valid, which is a
+    lot cheaper than six rounds of division.
+
+    Test:
+    >>> np is None or validate_array([123456, 121343, 12345, 1234567]).tolist() == [
+    ...     True, False, False, False]
+    True
+    >>> np is None or validate_array([[1, 2, 1, 3, 4, 5]]).tolist() == [True]
+    True
+    """
+
+    global _valid_table
+
+    codes = np.asarray(codes)
+    if codes.ndim == 2:
+        return validate_digits(codes)
+
+    if _valid_table is None:
+        every_code = np.arange(SMALLEST_CODE, LARGEST_CODE + 1)
+        _valid_table = validate_digits(
+            every_code[:, None] // 10 ** np.arange(5, -1, -1) % 10)
+
+    in_range = (codes >= SMALLEST_CODE) & (codes <= LARGEST_CODE)
+    index = np.where(in_range, codes - SMALLEST_CODE, 0)
+    return in_range & _valid_table[index]
+
+def main(argv=()):
+    """
+    Validates the postal code on stdin, or with --stream every line of stdin.
+    --parallel and --bitmap pick how the stream is validated, and --workers N
+    how many processes --parallel uses (one per core by default).  With
+    --build-bitmap [PATH], builds the bitmap that --bitmap [PATH] needs
+    instead.  Both default to BITMAP_PATH.
+    """
+
+    if "--build-bitmap" in argv:
+        with instrument.phase("solve"):
+            save_bitmap(path_option(argv, "--build-bitmap"))
+    elif "--stream" in argv:
+        workers = None if "--parallel" in argv else 1
+        if "--workers" in argv:
+            workers = int(argv[argv.index("--workers") + 1])
+        # Mapping the bitmap now means a missing one fails before any workers
+        # start, and they all share the one mapping.
+        if "--bitmap" in argv:
+            use_bitmap(path_option(argv, "--bitmap"))
+        with instrument.phase("solve"):
+            stream_validate(sys.stdin.buffer, sys.stdout.buffer,
+                            workers=workers,
+                            check=is_valid_bitmap if "--bitmap" in argv
+                            else is_valid)
+    else:
+        with instrument.phase("parse"):
+            solver = Solver()
+        with instrument.phase("solve"):
+            answer = solver.solve()
+        with instrument.phase("emit"):
+            print(answer)
 
 if __name__ == "__main__":
-    import doctest
-    doctest.testmod()
+    # The doctests only run for a plain run of the script.
+    if not sys.argv[1:]:
+        import doctest
+        doctest.testmod()
 
-    solver = Solver()
-    solver.solve()
+    main(sys.argv[1:])